@@ -0,0 +1,86 @@
+"""
+Concurrent-request throughput of the sync and async catalog views under uvicorn.
+
+    python -m benchmarks.bench_async [--products 1000] [--concurrency 1,10,50] [--duration 5]
+
+Seeds a throwaway SQLite database, then starts one uvicorn worker per mode
+(ASYNC_CATALOG_VIEWS=false/true) and drives it with keep-alive connections.
+The catalog cache is disabled unless --cache is given, so every request
+reaches the database.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.http import build_request, read_response, seed, server, server_env
+
+PATHS = ['/api/products/', '/api/products/?page=2', '/api/categories/', '/api/whatsapp/']
+
+
+async def client(port, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    sent = 0
+    try:
+        while time.perf_counter() < deadline:
+            path = PATHS[sent % len(PATHS)]
+            sent += 1
+            start = time.perf_counter()
+            writer.write(build_request('GET', path))
+            await writer.drain()
+            status, _ = await read_response(reader)
+            if status != 200:
+                errors.append(path)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def load(port, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(port, deadline, latencies, errors) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_server(env, async_views, args):
+    command = [sys.executable, '-m', 'uvicorn', 'core.asgi:application', '--port', '{port}',
+               '--log-level', 'warning', '--no-access-log']
+    with server(command, {**env, 'ASYNC_CATALOG_VIEWS': str(async_views).lower()}) as port:
+        asyncio.run(load(port, 1, 1))  # warm up
+        results = []
+        for concurrency in args.concurrency:
+            latencies, errors = asyncio.run(load(port, concurrency, args.duration))
+            results.append((concurrency, latencies, errors))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--concurrency', default='1,10,50', type=lambda value: [int(n) for n in value.split(',')])
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--cache', action='store_true', help='keep the catalog cache enabled')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = server_env(f'{directory}/bench.sqlite3')
+        if not args.cache:
+            env['CACHE_BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
+        seed(env, args.products)
+
+        print(f"{'views':>6} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for async_views in (False, True):
+            for concurrency, latencies, errors in run_server(env, async_views, args):
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                print(
+                    f"{'async' if async_views else 'sync':>6} {concurrency:>8} {len(latencies) / args.duration:>9.0f}"
+                    f" {statistics.median(latencies) * 1000:>8.1f} {p99 * 1000:>8.1f} {len(errors):>7}"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Batch regeneration of image derivatives by worker count.
+
+    python -m benchmarks.bench_derivatives [--images 200] [--workers 1,2,4,8] [--size 1600x1200]
+
+Writes ``--images`` distinct source JPEGs under a temporary MEDIA_ROOT and
+renders every variant from scratch for each worker count. Rendering is CPU
+bound, so throughput should scale with the worker count up to the number of
+cores.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import test_database
+
+from django.test import override_settings
+from PIL import Image, ImageDraw
+
+from main import derivatives, seeding
+from main.models import ProductImage
+
+
+def write_sources(media_root, size):
+    width, height = size
+    for image in ProductImage.objects.values('id', 'image'):
+        path = os.path.join(media_root, image['image'][len('/media/'):])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A gradient with a few shapes, so every source hashes differently and encodes like a photo
+        source = Image.linear_gradient('L').resize(size).convert('RGB')
+        draw = ImageDraw.Draw(source)
+        for n in range(8):
+            x, y = (image['id'] * 37 + n * 101) % width, (image['id'] * 53 + n * 67) % height
+            draw.ellipse((x, y, x + width // 5, y + height // 5), fill=(image['id'] % 255, 40 * n % 255, 90))
+        source.save(path, 'JPEG', quality=90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=200)
+    default_workers = sorted({1, 2, 4, os.cpu_count()})
+    parser.add_argument('--workers', default=','.join(str(workers) for workers in default_workers))
+    parser.add_argument('--size', default='1600x1200', help='Source image size')
+    args = parser.parse_args()
+    size = tuple(int(side) for side in args.size.split('x'))
+
+    print(f"{os.cpu_count()} CPUs, formats: {', '.join(derivatives.available_formats())}")
+    print(f"{'workers':>8} {'seconds':>8} {'images/s':>9} {'speedup':>8}")
+    with test_database(), tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        seeding.seed(10, args.images, images_per_product=1)
+        write_sources(media_root, size)
+        baseline = None
+        for workers in (int(workers) for workers in args.workers.split(',')):
+            shutil.rmtree(os.path.join(media_root, derivatives.DIRECTORY), ignore_errors=True)
+            start = time.perf_counter()
+            rendered, failed = derivatives.regenerate(ProductImage.objects.all(), workers=workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>8.2f} {rendered / elapsed:>9.1f} {baseline / elapsed:>7.2f}x"
+                  + (f"  ({failed} failed)" if failed else ''))
+
+
+if __name__ == '__main__':
+    main()
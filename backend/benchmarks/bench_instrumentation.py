@@ -0,0 +1,49 @@
+"""
+Overhead of RequestMetricsMiddleware.
+
+    python -m benchmarks.bench_instrumentation [--products 500] [--repeat 300]
+
+Times uncached product list and detail requests through the test client with
+the middleware on and off.
+"""
+import argparse
+import itertools
+
+from benchmarks.common import measure, test_database
+
+from django.conf import settings
+from django.test import Client, override_settings
+
+from main import seeding
+from main.models import Product
+
+WITHOUT = [name for name in settings.MIDDLEWARE if name != 'main.instrumentation.RequestMetricsMiddleware']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<16} {'off ms':>8} {'on ms':>8} {'overhead':>9}")
+    with test_database():
+        seeding.seed(10, args.products)
+        product = Product.objects.order_by('id').first()
+        # A fresh query string per request misses the catalog cache
+        counter = itertools.count()
+        for name, url in (('product list', '/api/products/'), ('product detail', f'/api/products/{product.pk}/')):
+            timings = {}
+            for label, middleware, enabled in (('off', WITHOUT, False), ('on', settings.MIDDLEWARE, True)):
+                with override_settings(MIDDLEWARE=middleware, REQUEST_METRICS=enabled):
+                    client = Client()
+                    def request():
+                        return client.get(url, {'n': next(counter)}, HTTP_ACCEPT='application/json')
+                    request()
+                    timings[label] = measure(request, args.repeat)
+            overhead = (timings['on'] / timings['off'] - 1) * 100
+            print(f"{name:<16} {timings['off'] * 1000:>8.2f} {timings['on'] * 1000:>8.2f} {overhead:>8.1f}%")
+
+
+if __name__ == '__main__':
+    main()
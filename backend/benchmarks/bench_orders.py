@@ -0,0 +1,50 @@
+"""
+Order creation cost by cart size, with server-side pricing.
+
+    python -m benchmarks.bench_orders [--lines 1,10,50,100,200]
+"""
+import argparse
+
+from benchmarks.common import measure, test_database
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from main import orders, seeding
+from main.serializers import OrderCreateSerializer
+
+
+def create_order(products, lines):
+    serializer = OrderCreateSerializer(data={
+        'customer_name': 'Benchmark',
+        'customer_email': 'bench@example.com',
+        'customer_phone': '1234567890',
+        'customer_address': '1 Bench St',
+        'order_items': [{'product': product.pk, 'quantity': 1 + i % 3} for i, product in enumerate(products[:lines])],
+    })
+    serializer.is_valid(raise_exception=True)
+    return orders.save_order(serializer, lambda order: {'order_id': order.id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', default='1,10,50,100,200')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'lines':>6} {'queries':>8} {'ms/order':>9}")
+    with test_database():
+        # Products without a stock count, so the repeated orders never sell out
+        products = [
+            product for product in seeding.seed(10, 1000, images_per_product=0)
+            if product.in_stock and product.stock_quantity is None
+        ]
+        for lines in (int(lines) for lines in args.lines.split(',')):
+            with CaptureQueriesContext(connection) as queries:
+                create_order(products, lines)
+            elapsed = measure(lambda: create_order(products, lines), args.repeat)
+            print(f"{lines:>6} {len(queries):>8} {elapsed * 1000:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
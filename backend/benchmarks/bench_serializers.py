@@ -0,0 +1,51 @@
+"""
+Serialization throughput of ProductSerializer against the fast path.
+
+    python -m benchmarks.bench_serializers [--sizes 100,1000,10000]
+"""
+import argparse
+
+from benchmarks.common import measure, test_database
+
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from main import fastpath, seeding
+from main.models import Product
+from main.serializers import ProductSerializer
+
+
+def serializer_path(request):
+    fields = ProductSerializer.requested_fields(request)
+    products = ProductSerializer.setup_queryset(Product.objects.all(), fields)
+    data = ProductSerializer(products, many=True, context={'request': request}).data
+    return JSONRenderer().render(data)
+
+
+def fast_path(request):
+    fields = ProductSerializer.requested_fields(request)
+    rows = list(fastpath.product_values(Product.objects.all(), fields))
+    return JSONRenderer().render(fastpath.build_products(rows, fields, request))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    request = Request(RequestFactory().get('/api/products/'))
+    print(f"{'products':>10} {'serializer/s':>14} {'fast path/s':>14} {'speedup':>8}")
+    with test_database():
+        for size in (int(size) for size in args.sizes.split(',')):
+            seeding.clear()
+            seeding.seed(10, size)
+            assert serializer_path(request) == fast_path(request)
+            slow = measure(lambda: serializer_path(request), args.repeat)
+            fast = measure(lambda: fast_path(request), args.repeat)
+            print(f"{size:>10} {size / slow:>14.0f} {size / fast:>14.0f} {slow / fast:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Many concurrent buyers on one SKU with a fixed stock.
+
+    python -m benchmarks.bench_stock [--stock 100] [--buyers 500] [--concurrency 64] [--threads 32]
+
+Seeds a throwaway SQLite database, gives one product ``--stock`` units and
+starts gunicorn with gthread workers. Every buyer posts an order for one unit
+at once; the script reports the request rate and checks that exactly
+``--stock`` orders were accepted and nothing was oversold.
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.http import build_request, read_response, seed, server, server_env
+
+
+async def buy(port, product_id, buyer, limit):
+    body = json.dumps({
+        'customer_name': f'Buyer {buyer}',
+        'customer_email': 'buyer@example.com',
+        'customer_phone': '1234567890',
+        'customer_address': '1 Sale St',
+        'order_items': [{'product': product_id, 'quantity': 1}],
+    }).encode()
+    async with limit:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            writer.write(build_request('POST', '/api/orders/create/', body, {'Connection': 'close'}))
+            await writer.drain()
+            status, _ = await read_response(reader)
+            return status
+        finally:
+            writer.close()
+
+
+async def flash_sale(port, product_id, args):
+    limit = asyncio.Semaphore(args.concurrency)
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(buy(port, product_id, buyer, limit) for buyer in range(args.buyers)))
+    return Counter(statuses), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--buyers', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=64, help='requests in flight')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = f'{directory}/stock.sqlite3'
+        env = server_env(database)
+        seed(env, 10)
+        with sqlite3.connect(database) as db:
+            product_id = db.execute('SELECT id FROM main_product WHERE in_stock ORDER BY id LIMIT 1').fetchone()[0]
+            db.execute('UPDATE main_product SET stock_quantity = ? WHERE id = ?', (args.stock, product_id))
+
+        command = [sys.executable, '-m', 'gunicorn', 'core.wsgi:application', '--bind', '127.0.0.1:{port}',
+                   '--worker-class', 'gthread', '--threads', str(args.threads), '--log-level', 'warning']
+        with server(command, env) as port:
+            statuses, elapsed = asyncio.run(flash_sale(port, product_id, args))
+
+        with sqlite3.connect(database) as db:
+            remaining, in_stock = db.execute(
+                'SELECT stock_quantity, in_stock FROM main_product WHERE id = ?', (product_id,)
+            ).fetchone()
+            reserved = db.execute(
+                'SELECT COALESCE(SUM(quantity), 0) FROM main_stockreservation WHERE product_id = ? AND status != ?',
+                (product_id, 'released')
+            ).fetchone()[0]
+
+    sold = statuses[201]
+    print(f"{args.buyers} buyers, {args.stock} units: {args.buyers / elapsed:.0f} requests/s")
+    print(f"  accepted {sold}, rejected {statuses[400]}, errors {sum(statuses.values()) - sold - statuses[400]}")
+    print(f"  remaining {remaining}, reserved {reserved}, in_stock {bool(in_stock)}")
+    print(f"  oversold {max(sold - args.stock, 0)}, stock accounted for: {remaining + reserved == args.stock}")
+
+
+if __name__ == '__main__':
+    main()
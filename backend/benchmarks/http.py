@@ -0,0 +1,94 @@
+"""
+Minimal HTTP/1.1 client and server helpers for the load scripts.
+
+Deliberately free of Django imports: the parent process only drives the server.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start listening')
+
+
+def server_env(database_path, **overrides):
+    """Environment for a server process using a throwaway SQLite database"""
+    return {
+        **os.environ,
+        'DATABASE_URL': f'sqlite:///{database_path}',
+        'ALLOWED_HOSTS': '127.0.0.1',
+        'CORS_ALLOWED_ORIGINS': 'http://127.0.0.1',
+        'CSRF_TRUSTED_ORIGINS': 'http://127.0.0.1',
+        **overrides,
+    }
+
+
+def seed(env, products):
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.seed_database', '--products', str(products)],
+        cwd=BACKEND_DIR, env=env, check=True,
+    )
+
+
+@contextmanager
+def server(command, env):
+    """Run ``command`` (with {port} filled in) from the backend directory; yields the port"""
+    port = free_port()
+    process = subprocess.Popen([part.format(port=port) for part in command], cwd=BACKEND_DIR, env=env)
+    try:
+        wait_for_port(port, process)
+        yield port
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def build_request(method, path, body=b'', headers=None):
+    lines = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', 'Accept: application/json']
+    if body:
+        lines += ['Content-Type: application/json', f'Content-Length: {len(body)}']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+
+async def read_response(reader):
+    """Read one response; returns (status, body)"""
+    status = int((await reader.readline()).split()[1])
+    length, chunked = 0, False
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+    if not chunked:
+        return status, await reader.readexactly(length)
+    body = b''
+    while size := int((await reader.readline()).strip(), 16):
+        body += (await reader.readexactly(size + 2))[:-2]
+    await reader.readline()
+    return status, body
@@ -0,0 +1,96 @@
+"""
+Order ingestion under a retry storm, with and without group commit.
+
+    python -m benchmarks.load_orders [--orders 500] [--retries 3] [--concurrency 32] [--threads 32]
+
+Seeds a throwaway SQLite database and starts gunicorn with gthread workers.
+Every order is sent ``--retries`` times at once with the same Idempotency-Key,
+as a client that times out and retries would. The script reports accepted
+orders per second and checks that each key produced exactly one order, the
+same order_id for all of its copies.
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.http import build_request, read_response, seed, server, server_env
+
+MODES = {'per-request': 'false', 'group commit': 'true'}
+
+
+async def post_order(port, body, key):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(build_request('POST', '/api/orders/create/', body, {
+            'Idempotency-Key': key, 'Connection': 'close'
+        }))
+        await writer.drain()
+        status, content = await read_response(reader)
+        return json.loads(content).get('order_id') if status == 201 else None
+    finally:
+        writer.close()
+
+
+async def storm(port, args, product_ids, mode):
+    limit = asyncio.Semaphore(args.concurrency)
+    order_ids = {}
+
+    async def order(index):
+        body = json.dumps({
+            'customer_name': f'Customer {index}',
+            'customer_email': 'load@example.com',
+            'customer_phone': '1234567890',
+            'customer_address': '1 Load St',
+            'order_items': [{'product': product_ids[index % len(product_ids)], 'quantity': 1}],
+        }).encode()
+        async with limit:
+            copies = [post_order(port, body, f'{mode}-{index}') for _ in range(args.retries)]
+            order_ids[index] = await asyncio.gather(*copies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(order(index) for index in range(args.orders)))
+    return order_ids, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=32, help='orders in flight')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = f'{directory}/load.sqlite3'
+        env = server_env(database)
+        seed(env, 100)
+        with sqlite3.connect(database) as db:
+            # Products without a stock count, so the storm never sells out
+            product_ids = [row[0] for row in db.execute(
+                'SELECT id FROM main_product WHERE in_stock AND stock_quantity IS NULL'
+            )]
+
+        print(f"{'mode':>13} {'orders/s':>9} {'failed':>7} {'duplicates':>11}")
+        for mode, group_commit in MODES.items():
+            with sqlite3.connect(database) as db:
+                before = db.execute('SELECT COUNT(*) FROM main_order').fetchone()[0]
+            command = [sys.executable, '-m', 'gunicorn', 'core.wsgi:application', '--bind', '127.0.0.1:{port}',
+                       '--worker-class', 'gthread', '--threads', str(args.threads), '--log-level', 'warning']
+            with server(command, {**env, 'ORDER_GROUP_COMMIT': group_commit}) as port:
+                order_ids, elapsed = asyncio.run(storm(port, args, product_ids, mode))
+            with sqlite3.connect(database) as db:
+                created = db.execute('SELECT COUNT(*) FROM main_order').fetchone()[0] - before
+
+            accepted = [ids for ids in order_ids.values() if any(ids)]
+            # Every copy of a key must report the same order, and each key may create one order
+            split = sum(len(set(ids) - {None}) > 1 for ids in accepted)
+            duplicates = created - len(accepted) + split
+            print(f"{mode:>13} {len(accepted) / elapsed:>9.0f} {args.orders - len(accepted):>7} {duplicates:>11}")
+
+
+if __name__ == '__main__':
+    main()
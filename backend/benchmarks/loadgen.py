@@ -0,0 +1,283 @@
+"""
+Open-loop HTTP load generator for `manage.py loadtest`.
+
+Requests start on a Poisson schedule at the target rate whether or not earlier
+ones have finished, so a server that falls behind shows up as growing latency
+and a completed rate below the target instead of slowing the client down.
+Latency is measured from each request's scheduled start and so includes the
+time spent waiting for a free connection.
+
+Every request is one step of the shopper mix: the storefront grid (home), a
+category page (browse), a product page (product) or an order (order). Product
+and category ids are discovered through the API, so the generator works
+against any seeded database.
+"""
+import asyncio
+import json
+import random
+from bisect import bisect_left
+
+from benchmarks.http import build_request, read_response
+
+# Upper bounds of the latency histogram in milliseconds
+HISTOGRAM_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+DEFAULT_MIX = {'home': 35, 'browse': 30, 'product': 30, 'order': 5}
+
+
+def parse_mix(value):
+    """{'home': 35.0, ...} from 'home=35,browse=30,...'"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise ValueError("The mix needs a positive weight")
+    return mix
+
+
+def _path(url):
+    # Pagination links are absolute
+    return '/' + url.split('://', 1)[-1].partition('/')[2]
+
+
+class Catalog:
+    """The category ids with their page counts and the in-stock product ids the shoppers use"""
+
+    def __init__(self, categories, products):
+        self.categories = categories
+        self.products = products
+
+    @classmethod
+    async def discover(cls, port, max_pages=20):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+        async def get(path):
+            writer.write(build_request('GET', path))
+            await writer.drain()
+            status, body = await read_response(reader)
+            if status != 200:
+                raise RuntimeError(f"GET {path} answered {status}")
+            return json.loads(body)
+
+        try:
+            categories = {}
+            path = '/api/categories/'
+            for _ in range(max_pages):
+                page = await get(path)
+                for category in page['results']:
+                    first = await get(f"/api/products/?category={category['id']}&view=compact")
+                    per_page = max(len(first['results']), 1)
+                    categories[category['id']] = max(-(-first['count'] // per_page), 1)
+                if not page['next']:
+                    break
+                path = _path(page['next'])
+            products = []
+            for number in range(1, max_pages + 1):
+                page = await get(f'/api/products/?in_stock=true&fields=id&page={number}')
+                products.extend(product['id'] for product in page['results'])
+                if not page['next']:
+                    break
+        finally:
+            writer.close()
+        if not categories or not products:
+            raise RuntimeError("The catalog is empty; seed it first")
+        return cls(categories, products)
+
+
+class Shopper:
+    """Picks the next request of the mix: (scenario, method, path, body)"""
+
+    def __init__(self, catalog, mix, rng):
+        self.catalog = catalog
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.rng = rng
+        self.category_ids = list(catalog.categories)
+
+    def next_request(self):
+        name = self.rng.choices(self.names, self.weights)[0]
+        if name == 'home':
+            return name, 'GET', '/api/products/?view=compact', b''
+        if name == 'browse':
+            category = self.rng.choice(self.category_ids)
+            # Shoppers mostly stay on the first pages
+            page = min(int(self.rng.expovariate(0.7)) + 1, self.catalog.categories[category])
+            return name, 'GET', f'/api/products/?category={category}&view=compact&page={page}', b''
+        if name == 'product':
+            return name, 'GET', f'/api/products/{self.rng.choice(self.catalog.products)}/', b''
+        lines = self.rng.sample(self.catalog.products, min(self.rng.randint(1, 3), len(self.catalog.products)))
+        body = json.dumps({
+            'customer_name': 'Load Test',
+            'customer_email': 'load@example.com',
+            'customer_phone': '1234567890',
+            'customer_address': '1 Load St',
+            'order_items': [{'product': product, 'quantity': 1} for product in lines],
+        }).encode()
+        return name, 'POST', '/api/orders/create/', body
+
+
+class Connections:
+    """Keep-alive connections to the server, at most ``limit`` open at once"""
+
+    def __init__(self, port, limit):
+        self.port = port
+        self.idle = asyncio.Queue()
+        self.available = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        await self.available.acquire()
+        if not self.idle.empty():
+            return self.idle.get_nowait(), True
+        try:
+            return await asyncio.open_connection('127.0.0.1', self.port), False
+        except BaseException:
+            self.available.release()
+            raise
+
+    def release(self, connection, reusable):
+        if reusable:
+            self.idle.put_nowait(connection)
+        else:
+            connection[1].close()
+        self.available.release()
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait()[1].close()
+
+
+async def _send(connections, method, path, body):
+    """The response status; a reused connection the server already closed is replaced once"""
+    for attempt in range(2):
+        (reader, writer), reused = await connections.acquire()
+        try:
+            writer.write(build_request(method, path, body))
+            await writer.drain()
+            status, _ = await read_response(reader)
+        except (ConnectionError, IndexError, asyncio.IncompleteReadError) as exc:
+            connections.release((reader, writer), False)
+            # An idle keep-alive connection timed out on the server: nothing was processed
+            if reused and attempt == 0:
+                continue
+            raise ConnectionError(str(exc) or type(exc).__name__)
+        except BaseException:
+            connections.release((reader, writer), False)
+            raise
+        connections.release((reader, writer), True)
+        return status
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.outcomes = {}
+
+    def record(self, scenario, seconds, outcome):
+        self.latencies.setdefault(scenario, []).append(seconds * 1000)
+        counts = self.outcomes.setdefault(scenario, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    def summary(self, target, duration, elapsed):
+        """
+        Totals, per-scenario percentiles and the latency histogram as a dict.
+        Rates are over ``elapsed``, from the first scheduled request to the
+        last response, so a backlog the server works off after ``duration``
+        lowers them.
+        """
+        all_latencies = sorted(ms for values in self.latencies.values() for ms in values)
+        totals = {}
+        for counts in self.outcomes.values():
+            for outcome, count in counts.items():
+                totals[outcome] = totals.get(outcome, 0) + count
+        sent = sum(totals.values())
+        # 4xx answers (an order for a product that sold out) are served requests, not errors
+        completed = totals.get('2xx', 0) + totals.get('4xx', 0)
+        errors = sent - completed
+        histogram = [0] * (len(HISTOGRAM_MS) + 1)
+        for ms in all_latencies:
+            histogram[bisect_left(HISTOGRAM_MS, ms)] += 1
+        return {
+            'target_rps': target,
+            'duration_s': duration,
+            'sent': sent,
+            'offered_rps': round(sent / duration, 1),
+            'completed_rps': round(completed / elapsed, 1) if elapsed else 0.0,
+            'error_rate': round(errors / sent, 4) if sent else 0.0,
+            'rejected': totals.get('4xx', 0),
+            'outcomes': totals,
+            **percentiles(all_latencies),
+            'scenarios': {
+                name: {'requests': len(values), 'outcomes': self.outcomes[name], **percentiles(sorted(values))}
+                for name, values in self.latencies.items()
+            },
+            'histogram_ms': {
+                **{f'le_{bound}': count for bound, count in zip(HISTOGRAM_MS, histogram)},
+                'inf': histogram[-1],
+            },
+        }
+
+
+def percentiles(ordered):
+    if not ordered:
+        return {'p50_ms': None, 'p90_ms': None, 'p99_ms': None, 'max_ms': None}
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+    return {'p50_ms': at(0.5), 'p90_ms': at(0.9), 'p99_ms': at(0.99), 'max_ms': round(ordered[-1], 2)}
+
+
+async def run_step(port, shopper, rps, duration, connections=256, timeout=10.0, rng=None):
+    """Offer ``rps`` requests a second for ``duration`` seconds; returns (Results, elapsed seconds)"""
+    rng = rng or random.Random(0)
+    pool = Connections(port, connections)
+    results = Results()
+    loop = asyncio.get_running_loop()
+
+    async def request(scheduled, scenario, method, path, body):
+        try:
+            status = await asyncio.wait_for(_send(pool, method, path, body), timeout)
+            outcome = f'{status // 100}xx'
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+        except OSError:
+            outcome = 'connection error'
+        results.record(scenario, loop.time() - scheduled, outcome)
+
+    tasks = []
+    start = loop.time()
+    scheduled = start
+    while True:
+        scheduled += rng.expovariate(rps)
+        if scheduled - start >= duration:
+            break
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(request(scheduled, *shopper.next_request())))
+    await asyncio.gather(*tasks)
+    pool.close()
+    return results, loop.time() - start
+
+
+def saturated(summary, max_error_rate, p99_ms=None):
+    """Why this step counts as past saturation, or None"""
+    if summary['completed_rps'] < 0.95 * summary['offered_rps']:
+        return f"completed {summary['completed_rps']} of {summary['offered_rps']} req/s offered"
+    if summary['error_rate'] > max_error_rate:
+        return f"error rate {summary['error_rate']:.1%}"
+    if p99_ms is not None and summary['p99_ms'] is not None and summary['p99_ms'] > p99_ms:
+        return f"p99 {summary['p99_ms']} ms over {p99_ms} ms"
+    return None
+
+
+def format_histogram(histogram, width=40):
+    counts = list(histogram.values())
+    labels = [f'<= {bound} ms' for bound in HISTOGRAM_MS] + [f'>  {HISTOGRAM_MS[-1]} ms']
+    peak = max(counts) or 1
+    return '\n'.join(
+        f'  {label:>11} |{"#" * round(width * count / peak):<{width}} {count}'
+        for label, count in zip(labels, counts)
+    )
@@ -0,0 +1,23 @@
+"""
+Migrate and seed the configured database (DATABASE_URL) for the server benchmarks.
+
+    DATABASE_URL=sqlite:////tmp/bench.sqlite3 python -m benchmarks.seed_database --products 1000
+"""
+import argparse
+
+import benchmarks.common  # noqa: F401  (sets up Django)
+
+from django.core.management import call_command
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=1000)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    call_command('seed_catalog', '--clear', '--products', str(args.products), '--orders', '0')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+Latency, query count and memory of every /api/ endpoint, order creation and the
+admin changelists, at several catalog sizes.
+
+    python -m benchmarks.suite [--sizes 100,1000,10000] [--repeat 20] [--output results.json]
+    python -m benchmarks.suite --baseline main.json --output branch.json
+
+Each size is a fresh catalog from main.seeding (the same --seed gives the same
+rows), with as many orders as products. Requests go through the Django test
+client, including the middleware; /api/ GET requests carry a unique query
+parameter, so they measure the work behind the catalog cache rather than a
+cache hit.
+For every scenario the suite records the median and p95 latency, the number
+of SQL statements and the peak memory traced while serving one request.
+
+Results are written as JSON. Given a --baseline from an earlier run, the
+suite compares the two and exits with status 1 if any scenario got slower,
+ran more queries or used more memory than the thresholds allow.
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.common import test_database
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, resolve
+
+from main import seeding
+from main.models import Category, Product, ProductImage
+
+ROUTES_WITHOUT_SCENARIO = {'api-root'}
+
+
+class Scenario:
+    """One request; ``path`` and ``data`` may be callables of the catalog context, evaluated per request"""
+
+    def __init__(self, name, path, method='get', data=None, user=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.user = user
+
+    def request(self, clients, context, counter):
+        path = self.path(context) if callable(self.path) else self.path
+        data = self.data(context) if callable(self.data) else self.data
+        client = clients[self.user]
+        if self.method == 'get':
+            params = dict(data or {})
+            if path.startswith('/api/'):
+                # Miss the catalog cache; the admin would reject an unknown parameter
+                params['_bench'] = next(counter)
+            return client.get(path, params, HTTP_ACCEPT='application/json')
+        return getattr(client, self.method)(path, json.dumps(data), content_type='application/json',
+                                            HTTP_ACCEPT='application/json')
+
+
+def _new_product(context):
+    return {'name': 'Benchmark product', 'description': 'Created by the benchmark suite', 'price': '9.99',
+            'category': context['category']}
+
+
+def _order(context):
+    return {
+        'customer_name': 'Benchmark', 'customer_email': 'bench@example.com', 'customer_phone': '1234567890',
+        'customer_address': '1 Bench St',
+        'order_items': [{'product': pk, 'quantity': 1} for pk in context['order_products']],
+    }
+
+
+def _reordered_images(context):
+    ids = list(ProductImage.objects.filter(product=context['product']).order_by('order', 'id')
+               .values_list('id', flat=True))
+    return {'order': ids[::-1]}
+
+
+SCENARIOS = [
+    Scenario('categories', '/api/categories/'),
+    Scenario('category', lambda c: f"/api/categories/{c['category']}/"),
+    Scenario('products', '/api/products/'),
+    Scenario('products_filtered', '/api/products/', data=lambda c: {'category': c['category'], 'in_stock': 'true'}),
+    Scenario('products_cursor', '/api/products/', data={'pagination': 'cursor'}),
+    Scenario('products_deep_page', '/api/products/', data=lambda c: {'page': c['last_page']}),
+    Scenario('product', lambda c: f"/api/products/{c['product']}/"),
+    Scenario('product_facets', '/api/products/facets/'),
+    Scenario('product_search', '/api/products/search/', data=lambda c: {'q': c['search_term']}),
+    Scenario('product_create', '/api/products/', 'post', _new_product),
+    Scenario('product_update', lambda c: f"/api/products/{c['product']}/", 'patch', {'featured': True}),
+    Scenario('product_images_attach', lambda c: f"/api/products/{c['product']}/images/", 'post',
+             lambda c: {'images': [{'image': f"https://example.com/bench/{next(c['counter'])}.jpg"}]}, user='admin'),
+    Scenario('product_images_reorder', lambda c: f"/api/products/{c['product']}/images/", 'patch',
+             _reordered_images, user='admin'),
+    Scenario('orders', '/api/orders/', user='admin'),
+    Scenario('orders_export', '/api/orders/export/', data={'format': 'ndjson'}, user='admin'),
+    Scenario('create_order', '/api/orders/create/', 'post', _order),
+    Scenario('metrics', '/api/metrics/', user='admin'),
+    Scenario('whatsapp', '/api/whatsapp/'),
+    Scenario('cart', '/api/cart/', user='shopper'),
+    Scenario('cart_add', '/api/cart/items/', 'post', lambda c: {'product': c['product'], 'quantity': 1},
+             user='shopper'),
+    Scenario('cart_update', lambda c: f"/api/cart/items/{c['product']}/", 'patch', {'quantity': 2}, user='shopper'),
+    Scenario('admin_categories', '/admin/main/category/', user='admin'),
+    Scenario('admin_products', '/admin/main/product/', user='admin'),
+    Scenario('admin_product_images', '/admin/main/productimage/', user='admin'),
+    Scenario('admin_orders', '/admin/main/order/', user='admin'),
+    Scenario('admin_order_search', '/admin/main/order/', data={'q': 'a'}, user='admin'),
+]
+
+
+def uncovered_routes(scenarios, context):
+    """Names of /api/ routes no scenario requests"""
+    covered = set()
+    for scenario in scenarios:
+        path = scenario.path(context) if callable(scenario.path) else scenario.path
+        covered.add(resolve(path).view_name)
+    routes = set()
+    for pattern in get_resolver('main.urls').reverse_dict.keys():
+        if isinstance(pattern, str):
+            routes.add(pattern)
+    return sorted(routes - covered - ROUTES_WITHOUT_SCENARIO)
+
+
+def catalog_context(size):
+    product = Product.objects.filter(in_stock=True, stock_quantity__isnull=True).order_by('id').first()
+    # Orders use products without stock counters, so repeated orders never sell out
+    unlimited = Product.objects.filter(in_stock=True, stock_quantity__isnull=True).order_by('id')
+    return {
+        'category': Category.objects.order_by('id').values_list('id', flat=True).first(),
+        'product': product.pk,
+        'order_products': list(unlimited.values_list('id', flat=True)[:3]),
+        'search_term': product.name.split()[0],
+        'last_page': max((size + settings.REST_FRAMEWORK['PAGE_SIZE'] - 1) // settings.REST_FRAMEWORK['PAGE_SIZE'], 1),
+        'counter': itertools.count(),
+    }
+
+
+def clients():
+    admin = User.objects.create_superuser('benchmark-admin', 'admin@example.com', 'benchmark')
+    shopper = User.objects.create_user('benchmark-shopper', 'shopper@example.com', 'benchmark')
+    result = {None: Client(), 'admin': Client(), 'shopper': Client()}
+    result['admin'].force_login(admin)
+    result['shopper'].force_login(shopper)
+    return result
+
+
+def drain(response):
+    # Chunk by chunk, so a streamed response's peak memory is the server's, not a joined body's
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+def run_scenario(scenario, clients, context, counter, repeat):
+    response = scenario.request(clients, context, counter)
+    if not 200 <= response.status_code < 300:
+        raise RuntimeError(f"{scenario.name}: {scenario.method.upper()} answered {response.status_code}")
+    drain(response)
+
+    def serve():
+        drain(scenario.request(clients, context, counter))
+
+    # The request_started signal empties the query log, and the captured queries are read from that log:
+    # start from an empty one and count before the next request
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        serve()
+    query_count = len(queries)
+    tracemalloc.start()
+    serve()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        serve()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'method': scenario.method.upper(),
+        'status': response.status_code,
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(statistics.quantiles(timings, n=20)[18] if len(timings) > 1 else timings[0], 3),
+        'queries': query_count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(baseline, current, latency_pct, query_increase, memory_pct, min_ms=1.0, min_kb=64.0):
+    """Regressions of ``current`` against ``baseline`` as messages; scenarios missing from either are skipped"""
+    regressions = []
+    for size, scenarios in current['results'].items():
+        for name, result in scenarios.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if before is None:
+                continue
+            label = f"{name} at {size} products"
+            if (result['median_ms'] > before['median_ms'] * (1 + latency_pct / 100)
+                    and result['median_ms'] - before['median_ms'] >= min_ms):
+                regressions.append(f"{label}: median {before['median_ms']} -> {result['median_ms']} ms")
+            if result['queries'] > before['queries'] + query_increase:
+                regressions.append(f"{label}: {before['queries']} -> {result['queries']} queries")
+            if (result['peak_kb'] > before['peak_kb'] * (1 + memory_pct / 100)
+                    and result['peak_kb'] - before['peak_kb'] >= min_kb):
+                regressions.append(f"{label}: peak memory {before['peak_kb']} -> {result['peak_kb']} KiB")
+    return regressions
+
+
+def commit():
+    try:
+        head = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head + ('-dirty' if dirty else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000', help='Catalog sizes in products')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed requests per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help='Comma separated scenario names')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--max-latency-regression', type=float, default=25.0,
+                        help='Allowed median latency increase in percent')
+    parser.add_argument('--max-query-increase', type=int, default=0, help='Allowed extra SQL statements')
+    parser.add_argument('--max-memory-regression', type=float, default=25.0,
+                        help='Allowed peak memory increase in percent')
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.only:
+        names = set(args.only.split(','))
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+
+    results = {}
+    # Timed requests would otherwise fill the output with slow_request log lines
+    with test_database(), override_settings(SLOW_REQUEST_MS=float('inf')):
+        users = clients()
+        counter = itertools.count()
+        for size in (int(size) for size in args.sizes.split(',')):
+            seeding.clear()
+            seeding.seed(max(size // 50, 5), size, orders=size, seed=args.seed)
+            context = catalog_context(size)
+            if size == int(args.sizes.split(',')[0]):
+                for route in uncovered_routes(SCENARIOS, context):
+                    print(f"warning: no scenario requests the {route} route", file=sys.stderr)
+
+            print(f"\n{size} products")
+            print(f"{'scenario':<24} {'median ms':>10} {'p95 ms':>8} {'queries':>8} {'peak KiB':>9}")
+            results[str(size)] = {}
+            for scenario in scenarios:
+                result = run_scenario(scenario, users, context, counter, args.repeat)
+                results[str(size)][scenario.name] = result
+                print(f"{scenario.name:<24} {result['median_ms']:>10.2f} {result['p95_ms']:>8.2f} "
+                      f"{result['queries']:>8} {result['peak_kb']:>9.1f}")
+
+    report = {
+        'meta': {
+            'commit': commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, report, args.max_latency_regression, args.max_query_increase,
+                              args.max_memory_regression)
+        if regressions:
+            print(f"\n{len(regressions)} regressions against {args.baseline}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""
+URL configuration for ASGI deployments: core.urls with the catalog endpoints
+served by main.async_views. Selected with ASYNC_CATALOG_VIEWS=true.
+"""
+from django.contrib import admin
+from django.urls import path, include
+from django.conf import settings
+from django.conf.urls.static import static
+from main.admin import download_profile, request_profiles
+
+
+urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(request_profiles), name='admin-request-profiles'),
+    path('admin/profiles/<str:profile_id>.prof', admin.site.admin_view(download_profile),
+         name='admin-request-profile-download'),
+    path('admin/', admin.site.urls),
+    path('api/', include('main.async_urls')),
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
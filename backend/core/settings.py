@@ -11,9 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 from email.policy import default
 from pathlib import Path
+from importlib.util import find_spec
 import os
 from dotenv import load_dotenv
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Load environment variables from .env file
 load_dotenv()
@@ -54,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.instrumentation.RequestMetricsMiddleware',
+    'main.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.middleware.security.SecurityMiddleware',
@@ -65,7 +69,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'core.urls'
+# Serve the catalog through the native async views (main.async_views); for ASGI deployments
+ASYNC_CATALOG_VIEWS = config('ASYNC_CATALOG_VIEWS', 'false').lower() == 'true'
+
+ROOT_URLCONF = 'core.async_urls' if ASYNC_CATALOG_VIEWS else 'core.urls'
 
 TEMPLATES = [
     {
@@ -93,6 +100,112 @@ DATABASES = {
     "default": dj_database_url.config(default="sqlite:///db.sqlite3")
 }
 
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at the file based
+# backend (or Redis) to share entries between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', 'ecommerce'),
+    }
+}
+
+# Catalog responses are fresh for CATALOG_CACHE_TIMEOUT seconds and then served
+# stale for up to CATALOG_CACHE_STALE_TIMEOUT seconds while one worker rebuilds them.
+CATALOG_CACHE_TIMEOUT = int(config('CATALOG_CACHE_TIMEOUT', 300))
+CATALOG_CACHE_STALE_TIMEOUT = int(config('CATALOG_CACHE_STALE_TIMEOUT', 60))
+CATALOG_CACHE_LOCK_TIMEOUT = int(config('CATALOG_CACHE_LOCK_TIMEOUT', 30))
+
+# Build catalog list responses from values() rows instead of running the serializers
+CATALOG_FAST_PATH = config('CATALOG_FAST_PATH', 'true').lower() == 'true'
+
+# Upper bound on the ranked matches a product search paginates over
+SEARCH_MAX_RESULTS = int(config('SEARCH_MAX_RESULTS', 1000))
+
+# Lower bounds of the price ranges offered as a facet; the last range is open ended
+FACET_PRICE_BUCKETS = [0, 500, 1000, 2500, 5000]
+
+# Most lines a single order may contain
+ORDER_MAX_ITEMS = int(config('ORDER_MAX_ITEMS', 200))
+# Largest quantity of one line
+ORDER_MAX_QUANTITY = int(config('ORDER_MAX_QUANTITY', 999))
+
+# Write concurrent orders in shared transactions: the first request waits up to
+# ORDER_GROUP_COMMIT_WINDOW seconds (or until ORDER_GROUP_COMMIT_MAX_BATCH orders
+# are queued) and commits them together. Only helps multi-threaded workers.
+ORDER_GROUP_COMMIT = config('ORDER_GROUP_COMMIT', 'false').lower() == 'true'
+ORDER_GROUP_COMMIT_WINDOW = float(config('ORDER_GROUP_COMMIT_WINDOW', 0.005))
+ORDER_GROUP_COMMIT_MAX_BATCH = int(config('ORDER_GROUP_COMMIT_MAX_BATCH', 50))
+
+# Order notifications are delivered by `manage.py process_outbox`, never on the request path.
+# Leave both empty to only log them.
+ORDER_NOTIFICATION_EMAILS = [email for email in config('ORDER_NOTIFICATION_EMAILS', '').split(',') if email]
+ORDER_NOTIFICATION_WEBHOOK = config('ORDER_NOTIFICATION_WEBHOOK', '')
+OUTBOX_BATCH_SIZE = int(config('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_MAX_ATTEMPTS = int(config('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_BACKOFF_SECONDS = int(config('OUTBOX_BACKOFF_SECONDS', 5))
+OUTBOX_MAX_BACKOFF_SECONDS = int(config('OUTBOX_MAX_BACKOFF_SECONDS', 3600))
+# A claimed message is retried after this long if its worker never reports back
+OUTBOX_LEASE_SECONDS = int(config('OUTBOX_LEASE_SECONDS', 300))
+
+# Server-side carts live in the cache (see main.cart) and are written to the
+# database CART_FLUSH_INTERVAL seconds after a change; 0 leaves flushing to
+# `manage.py flush_carts`. That needs a shared cache such as Redis: with the
+# local memory default every change is written to the database right away.
+CART_CACHE_TIMEOUT = int(config('CART_CACHE_TIMEOUT', 14 * 24 * 3600))
+CART_FLUSH_INTERVAL = int(config('CART_FLUSH_INTERVAL', 30))
+CART_FLUSH_BATCH_SIZE = int(config('CART_FLUSH_BATCH_SIZE', 500))
+CART_FLUSH_LOCK_TIMEOUT = int(config('CART_FLUSH_LOCK_TIMEOUT', 300))
+CART_MAX_QUANTITY = int(config('CART_MAX_QUANTITY', 99))
+CART_MAX_ITEMS = int(config('CART_MAX_ITEMS', 50))
+
+# Stock reserved by an order goes back on sale when the order is cancelled, and
+# `manage.py release_stock_reservations` cancels orders still pending
+# STOCK_RESERVATION_MINUTES after they were placed. Turn CANCEL_EXPIRED_ORDERS off
+# if staff confirm orders by hand later than that; pending orders then keep their stock.
+STOCK_RESERVATION_MINUTES = int(config('STOCK_RESERVATION_MINUTES', 30))
+CANCEL_EXPIRED_ORDERS = config('CANCEL_EXPIRED_ORDERS', 'true').lower() == 'true'
+
+# Per-request SQL and latency metrics: Server-Timing headers, a JSON log line with
+# the slowest statements for requests over SLOW_REQUEST_MS, and /api/metrics/
+REQUEST_METRICS = config('REQUEST_METRICS', 'true').lower() == 'true'
+SLOW_REQUEST_MS = int(config('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_STATEMENTS = int(config('SLOW_REQUEST_STATEMENTS', 5))
+
+# Staff request profiling (main.profiling): requests sent with a token from the
+# admin's Request profiles page are profiled into PROFILE_DIR, which must stay
+# outside MEDIA_ROOT: profiles are only served through the staff-only admin page.
+# PROFILER is 'auto' (pyinstrument when installed) or 'cprofile'
+PROFILING = config('PROFILING', 'true').lower() == 'true'
+PROFILER = config('PROFILER', 'auto')
+PROFILE_DIR = Path(config('PROFILE_DIR', BASE_DIR / 'profiles'))
+PROFILE_TOKEN_MAX_AGE = int(config('PROFILE_TOKEN_MAX_AGE', 60 * 60))
+PROFILE_MAX_FILES = int(config('PROFILE_MAX_FILES', 50))
+
+# Product image variants (main.derivatives): size name -> maximum width in pixels
+IMAGE_DERIVATIVE_SIZES = {
+    name: int(width) for name, width in (
+        item.split(':') for item in config('IMAGE_DERIVATIVE_SIZES', 'thumbnail:160,card:480,zoom:1200').split(',')
+    )
+}
+IMAGE_DERIVATIVE_QUALITY = int(config('IMAGE_DERIVATIVE_QUALITY', 75))
+IMAGE_DERIVATIVE_MAX_BYTES = int(config('IMAGE_DERIVATIVE_MAX_BYTES', 20 * 1024 * 1024))
+IMAGE_DERIVATIVE_FETCH_TIMEOUT = int(config('IMAGE_DERIVATIVE_FETCH_TIMEOUT', 15))
+
+# Orders fetched per round trip (and encoded per chunk) by /api/orders/export/
+ORDER_EXPORT_CHUNK_SIZE = int(config('ORDER_EXPORT_CHUNK_SIZE', 2000))
+
+# Images accepted by one POST /api/products/<id>/images/
+PRODUCT_IMAGES_MAX_BATCH = int(config('PRODUCT_IMAGES_MAX_BATCH', 100))
+
+# Unfiltered admin changelists of tables with at least this many rows show the
+# planner's row estimate instead of running COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(config('ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000))
+
+# Idempotency keys older than this many hours are removed by purge_idempotency_keys
+IDEMPOTENCY_KEY_TTL_HOURS = int(config('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
@@ -101,6 +214,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # orjson backed JSON (stdlib fallback) plus MessagePack when msgpack is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'main.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['main.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'main.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ] + (['main.parsers.MessagePackParser'] if find_spec('msgpack') else []),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
@@ -114,6 +237,7 @@ REST_FRAMEWORK = {
 
 CORS_ALLOWED_ORIGINS = os.environ.get("CORS_ALLOWED_ORIGINS", "").split(",")
 CSRF_TRUSTED_ORIGINS = os.environ.get("CSRF_TRUSTED_ORIGINS", "").split(",")
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 
 # Password validation
@@ -187,6 +311,7 @@ JAZZMIN_SETTINGS = {
     "topmenu_links": [
         {"name": "Home", "url": "admin:index", "permissions": ["auth.view_user"]},
         {"name": "View Site", "url": "/", "new_window": True},
+        {"name": "Request profiles", "url": "admin-request-profiles", "permissions": ["auth.view_user"]},
         {"app": "main"},
     ],
 
@@ -19,12 +19,17 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
+from main.admin import download_profile, request_profiles
 
 
 router = DefaultRouter()
 
 
 urlpatterns = [
+    # Ahead of admin.site.urls, whose app index would claim admin/profiles/
+    path('admin/profiles/', admin.site.admin_view(request_profiles), name='admin-request-profiles'),
+    path('admin/profiles/<str:profile_id>.prof', admin.site.admin_view(download_profile),
+         name='admin-request-profile-download'),
     path('admin/', admin.site.urls),
     path('api/', include('main.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,6 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
+from django.db.models import Count
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
-from .models import Category, Product, Order, ProductImage
+from . import profiling
+from .models import Category, Product, Order, OrderItem, ProductImage
+from .pagination import EstimatedCountPaginator
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -24,11 +30,18 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ['category', 'in_stock', 'featured']
     search_fields = ['name', 'description']
     list_editable = ['in_stock', 'featured']
+    list_select_related = ['category']
     inlines = [ProductImageInline]
-    
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(image_total=Count('productimage'))
+
     def image_count(self, obj):
-        return obj.images.count()
+        return obj.image_total
     image_count.short_description = 'Images'
+    image_count.admin_order_field = 'image_total'
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
@@ -36,7 +49,10 @@ class ProductImageAdmin(admin.ModelAdmin):
     list_filter = ['is_primary', 'product__category']
     search_fields = ['product__name', 'alt_text']
     list_editable = ['is_primary', 'order']
+    list_select_related = ['product']
     readonly_fields = ['preview']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def preview(self, obj):
         if obj.image:
@@ -44,10 +60,50 @@ class ProductImageAdmin(admin.ModelAdmin):
         return "(No image)"
     preview.short_description = 'Preview'
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    can_delete = False
+    fields = ['product', 'name', 'quantity', 'unit_price']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id','customer_name','customer_email','total_amount', 'status', 'created_at']
     list_filter = ['status','created_at']
-    search_fields = ['customer_name','customer_email']
+    # Prefix searches, served by the order_*_prefix_idx indexes
+    search_fields = ['^customer_name','^customer_email']
+    # Newest first, in the order of the order_created_idx and order_status_created_idx
+    # indexes; the default -pk ordering made a status filter scan the whole table
+    ordering = ['-created_at', '-id']
     readonly_fields = ['created_at']
+    inlines = [OrderItemInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+def request_profiles(request):
+    """Recent request profiles; POST issues a profiling token for the signed-in user"""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': profiling.recent_profiles(),
+        'token': profiling.issue_token(request.user) if request.method == 'POST' else None,
+        'token_minutes': settings.PROFILE_TOKEN_MAX_AGE // 60,
+        'max_files': settings.PROFILE_MAX_FILES,
+    }
+    return TemplateResponse(request, 'admin/main/request_profiles.html', context)
+
 
+def download_profile(request, profile_id):
+    try:
+        path = profiling.profile_path(profile_id)
+    except ValueError:
+        raise Http404
+    if not path.exists():
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name,
+                        content_type='application/octet-stream')
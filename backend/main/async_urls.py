@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# The async views come first; every other route falls through to main.urls
+urlpatterns = [
+    path('products/', async_views.product_list, name='product-list'),
+    path('products/<int:pk>/', async_views.product_detail, name='product-detail'),
+    path('categories/', async_views.category_list, name='category-list'),
+    path('whatsapp/', async_views.get_whatsapp_number, name='whatsapp-number'),
+] + sync_urlpatterns
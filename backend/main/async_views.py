@@ -0,0 +1,144 @@
+"""
+Native async catalog views for the ASGI deployment.
+
+The sync DRF views cost every ASGI request a hop onto the thread pool, which
+caps concurrency at the pool size. These views run on the event loop and use
+the async ORM instead. They build the same JSON as the sync views through
+main.fastpath and share their cache entries. Anything they don't serve natively
+(writes, ?pagination=cursor, CATALOG_FAST_PATH off) is handed to the sync view.
+
+Select them with ASYNC_CATALOG_VIEWS=true, which routes the API through
+core.async_urls.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import facets, fastpath, views
+from .cache import acached_data
+from .models import Category, Product
+from .renderers import ORJSONRenderer
+from .serializers import ProductSerializer
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class NotFound(Exception):
+    pass
+
+
+def json_response(data, status=200, **headers):
+    return HttpResponse(
+        ORJSONRenderer().render(data), content_type='application/json', status=status, headers=headers
+    )
+
+
+def sync_fallback(view):
+    """Run a sync DRF view from an async one; DRF responses are rendered in the worker thread"""
+    def render(request, *args, **kwargs):
+        return view(request, *args, **kwargs).render()
+    return sync_to_async(render)
+
+
+async def serve(request, build):
+    try:
+        data, cache_status = await acached_data(request, build)
+    except NotFound as exc:
+        return json_response({'detail': str(exc)}, status=404)
+    return json_response(data, **{'X-Cache': cache_status})
+
+
+async def paginate(request, queryset):
+    """PageNumberPagination's page of ``queryset`` as (rows, previous url, next url, count)"""
+    paginator = Paginator(queryset, api_settings.PAGE_SIZE)
+    paginator.count = await queryset.acount()
+    page_number = request.GET.get('page', 1)
+    if page_number == 'last':
+        page_number = paginator.num_pages
+    try:
+        number = paginator.validate_number(page_number)
+    except InvalidPage:
+        raise NotFound('Invalid page.')
+
+    bottom = (number - 1) * paginator.per_page
+    rows = [row async for row in queryset[bottom:bottom + paginator.per_page]]
+    url = request.build_absolute_uri()
+    previous_url = None
+    if number > 1:
+        previous_url = remove_query_param(url, 'page') if number == 2 else replace_query_param(url, 'page', number - 1)
+    next_url = replace_query_param(url, 'page', number + 1) if number < paginator.num_pages else None
+    return rows, {'count': paginator.count, 'next': next_url, 'previous': previous_url}
+
+
+def paginated(links, results):
+    return {'count': links['count'], 'next': links['next'], 'previous': links['previous'], 'results': results}
+
+
+async def build_products(request, rows, fields):
+    image_rows = fastpath.image_values([row['id'] for row in rows], fields)
+    if image_rows is not None:
+        image_rows = [row async for row in image_rows.aiterator()]
+    return fastpath.build_products(rows, fields, request, image_rows=image_rows or [])
+
+
+sync_category_list = sync_fallback(views.CategoryViewSet.as_view({'get': 'list'}))
+sync_product_list = sync_fallback(views.ProductViewSet.as_view({'get': 'list', 'post': 'create'}))
+sync_product_detail = sync_fallback(views.ProductViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'
+}))
+
+
+@csrf_exempt
+async def category_list(request):
+    if request.method not in SAFE_METHODS or not settings.CATALOG_FAST_PATH:
+        return await sync_category_list(request)
+
+    async def build():
+        rows, links = await paginate(request, Category.objects.values(*fastpath.CATEGORY_COLUMNS))
+        return paginated(links, fastpath.build_categories(rows))
+
+    return await serve(request, build)
+
+
+@csrf_exempt
+async def product_list(request):
+    if (
+        request.method not in SAFE_METHODS
+        or not settings.CATALOG_FAST_PATH
+        or request.GET.get('pagination') == 'cursor'
+    ):
+        return await sync_product_list(request)
+
+    async def build():
+        fields = ProductSerializer.requested_fields(request)
+        queryset = facets.filter_products(Product.objects.all(), facets.parse_filters(request.GET))
+        rows, links = await paginate(request, fastpath.product_values(queryset, fields))
+        return paginated(links, await build_products(request, rows, fields))
+
+    return await serve(request, build)
+
+
+@csrf_exempt
+async def product_detail(request, pk):
+    if request.method not in SAFE_METHODS:
+        return await sync_product_detail(request, pk=pk)
+
+    async def build():
+        fields = ProductSerializer.requested_fields(request)
+        try:
+            row = await fastpath.product_values(Product.objects.all(), fields).aget(pk=pk)
+        except Product.DoesNotExist:
+            raise NotFound('No Product matches the given query.')
+        return (await build_products(request, [row], fields))[0]
+
+    return await serve(request, build)
+
+
+async def get_whatsapp_number(request):
+    if request.method not in SAFE_METHODS:
+        return await sync_fallback(views.get_whatsapp_number)(request)
+    return json_response({'whatsapp_number': settings.WHATSAPP_NUMBER})
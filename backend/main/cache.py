@@ -0,0 +1,120 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from a timestamp so an evicted counter never reuses an old version
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def invalidate_catalog():
+    """Bump the catalog version now and again once the current transaction commits"""
+    bump_catalog_version()
+    # A reader racing the open transaction may cache old rows under the new version
+    if connection.in_atomic_block:
+        transaction.on_commit(bump_catalog_version)
+
+
+def catalog_cache_key(request):
+    # The absolute URI covers the host used for image URLs and every query parameter
+    url_hash = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f'catalog:{get_catalog_version()}:{url_hash}'
+
+
+def cached_response(request, build):
+    """
+    Read-through cache for catalog responses.
+
+    Entries outlive their freshness window by CATALOG_CACHE_STALE_TIMEOUT seconds.
+    Once stale, the first worker to take the rebuild lock refreshes the entry while
+    the others keep serving the stale copy.
+    """
+    key = catalog_cache_key(request)
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    locked = False
+    if entry is not None:
+        data, fresh_until = entry
+        if fresh_until > time.time():
+            return Response(data, headers={'X-Cache': 'HIT'})
+        locked = cache.add(lock_key, 1, settings.CATALOG_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            return Response(data, headers={'X-Cache': 'STALE'})
+
+    try:
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            timeout = settings.CATALOG_CACHE_TIMEOUT
+            cache.set(
+                key,
+                (response.data, time.time() + timeout),
+                timeout + settings.CATALOG_CACHE_STALE_TIMEOUT
+            )
+        response['X-Cache'] = 'MISS'
+        return response
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+async def aget_catalog_version():
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+async def acatalog_cache_key(request):
+    url_hash = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f'catalog:{await aget_catalog_version()}:{url_hash}'
+
+
+async def acached_data(request, build):
+    """
+    cached_response() for the async views.
+
+    ``build`` is a coroutine function returning the response data. Entries are
+    shared with the sync views; returns the data and the X-Cache value.
+    """
+    key = await acatalog_cache_key(request)
+    lock_key = f'{key}:lock'
+    entry = await cache.aget(key)
+    locked = False
+    if entry is not None:
+        data, fresh_until = entry
+        if fresh_until > time.time():
+            return data, 'HIT'
+        locked = await cache.aadd(lock_key, 1, settings.CATALOG_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            return data, 'STALE'
+
+    try:
+        data = await build()
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+        await cache.aset(key, (data, time.time() + timeout), timeout + settings.CATALOG_CACHE_STALE_TIMEOUT)
+        return data, 'MISS'
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
@@ -0,0 +1,242 @@
+"""
+Server-side carts keyed by session.
+
+The cache holds the live cart, {product id: quantity}, so adding, updating and
+removing an item is a cache read and write. Writes are persisted to the Cart
+table behind the request: every write appends the session key to a journal of
+sequence-numbered cache entries, and flush() upserts the journaled carts in
+batches. A background timer runs flush() CART_FLUSH_INTERVAL seconds after
+the first write of each interval; `manage.py flush_carts` runs it on demand.
+
+The cache then holds the only copy of unflushed writes, so write-behind is
+used only with a shared backend that doesn't cull (Redis, Memcached). With a
+per-process or culling backend, LocMemCache included, every change is written
+straight to the Cart table instead; `manage.py check --deploy` warns about it.
+Changes to one cart are serialized by a short lock in the cache, or by the
+row lock in the database, so concurrent clicks don't overwrite each other.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from . import pricing
+from .models import Cart, Product
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SEQUENCE_KEY = 'cart:journal'
+JOURNAL_FLUSHED_KEY = 'cart:journal:flushed'
+# The first journal entry a flush found missing; skipped if still missing next time
+JOURNAL_HOLE_KEY = 'cart:journal:hole'
+FLUSH_LOCK_KEY = 'cart:flush:lock'
+FLUSH_DUE_KEY = 'cart:flush:due'
+# Built-in backends that are per process or cull entries past MAX_ENTRIES
+UNSHARED_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+}
+# Seconds a cart update may hold its lock
+LOCK_TIMEOUT = 5
+
+
+class CartFull(Exception):
+    """Adding the product would take the cart past CART_MAX_ITEMS lines"""
+
+
+def write_behind():
+    """Whether carts live in the cache and are flushed later, rather than written on every change"""
+    return settings.CACHES['default']['BACKEND'] not in UNSHARED_CACHE_BACKENDS
+
+
+def cart_key(session_key):
+    return f'cart:{session_key}'
+
+
+def lock_key(session_key):
+    return f'cart:lock:{session_key}'
+
+
+def journal_key(sequence):
+    return f'cart:journal:{sequence}'
+
+
+def _stored_items(stored):
+    return {int(product_id): quantity for product_id, quantity in stored.items()}
+
+
+def get_items(session_key):
+    if not write_behind():
+        return _stored_items(Cart.objects.filter(session_key=session_key).values_list('items', flat=True).first() or {})
+    items = cache.get(cart_key(session_key))
+    if items is None:
+        # Evicted or never cached: fall back to the last flushed copy
+        stored = Cart.objects.filter(session_key=session_key).values_list('items', flat=True).first() or {}
+        items = _stored_items(stored)
+        cache.set(cart_key(session_key), items, settings.CART_CACHE_TIMEOUT)
+    return items
+
+
+def save_items(session_key, items):
+    cache.set(cart_key(session_key), items, settings.CART_CACHE_TIMEOUT)
+    _journal(session_key)
+    _schedule_flush()
+
+
+@contextmanager
+def _locked(session_key):
+    # add() is atomic on the shared backends write-behind runs on; a holder
+    # that died releases the lock when it expires
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key(session_key), 1, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Cart {session_key} is locked")
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        cache.delete(lock_key(session_key))
+
+
+def _update(session_key, change):
+    """Apply ``change`` to the cart's {product id: quantity} in place, one writer at a time; returns the items"""
+    if write_behind():
+        with _locked(session_key):
+            items = get_items(session_key)
+            change(items)
+            save_items(session_key, items)
+        return items
+    with transaction.atomic():
+        row, _ = Cart.objects.select_for_update().get_or_create(session_key=session_key)
+        items = _stored_items(row.items)
+        change(items)
+        row.items = {str(product_id): quantity for product_id, quantity in items.items()}
+        row.save(update_fields=['items', 'updated_at'])
+    return items
+
+
+def add_item(session_key, product_id, quantity):
+    def change(items):
+        if product_id not in items and len(items) >= settings.CART_MAX_ITEMS:
+            raise CartFull(f"A cart can hold at most {settings.CART_MAX_ITEMS} products.")
+        items[product_id] = min(items.get(product_id, 0) + quantity, settings.CART_MAX_QUANTITY)
+
+    return _update(session_key, change)
+
+
+def set_quantity(session_key, product_id, quantity):
+    """Change the quantity of a product already in the cart; 0 removes it"""
+    def change(items):
+        if not quantity:
+            items.pop(product_id, None)
+        elif product_id in items:
+            items[product_id] = min(quantity, settings.CART_MAX_QUANTITY)
+
+    return _update(session_key, change)
+
+
+def clear(session_key):
+    return _update(session_key, dict.clear)
+
+
+def priced_cart(items):
+    """The cart response for ``items``, priced from the current products in one query"""
+    products = Product.objects.filter(pk__in=items).values(*pricing.PRODUCT_COLUMNS)
+    lines = []
+    total = Decimal('0.00')
+    position = {product_id: index for index, product_id in enumerate(items)}
+    for product in sorted(products, key=lambda product: position[product['id']]):
+        quantity = items[product['id']]
+        price = pricing.unit_price(product['price'], product['discount'])
+        subtotal = price * quantity
+        if product['in_stock']:
+            total += subtotal
+        lines.append({
+            'product_id': product['id'],
+            'name': product['name'],
+            'price': str(price),
+            'quantity': quantity,
+            'subtotal': str(subtotal),
+            'in_stock': product['in_stock'],
+        })
+    return {
+        'items': lines,
+        'total': str(total),
+        'item_count': sum(line['quantity'] for line in lines if line['in_stock']),
+    }
+
+
+def _journal(session_key):
+    cache.add(JOURNAL_SEQUENCE_KEY, 0, timeout=None)
+    sequence = cache.incr(JOURNAL_SEQUENCE_KEY)
+    cache.set(journal_key(sequence), session_key, settings.CART_CACHE_TIMEOUT)
+
+
+def _schedule_flush():
+    interval = settings.CART_FLUSH_INTERVAL
+    if interval and cache.add(FLUSH_DUE_KEY, 1, interval):
+        # The first write of an interval schedules one flush at its end
+        timer = threading.Timer(interval, _background_flush)
+        timer.daemon = True
+        timer.start()
+
+
+def _background_flush():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Cart flush failed")
+    finally:
+        connection.close()
+
+
+def flush(batch_size=None):
+    """Persist every cart written since the last flush; returns the number of carts written"""
+    batch_size = batch_size or settings.CART_FLUSH_BATCH_SIZE
+    if not cache.add(FLUSH_LOCK_KEY, 1, settings.CART_FLUSH_LOCK_TIMEOUT):
+        return 0
+    written = 0
+    try:
+        flushed = cache.get(JOURNAL_FLUSHED_KEY, 0)
+        last = cache.get(JOURNAL_SEQUENCE_KEY, 0)
+        while flushed < last:
+            sequences = range(flushed + 1, min(last, flushed + batch_size) + 1)
+            entries = cache.get_many([journal_key(sequence) for sequence in sequences])
+            missing = [sequence for sequence in sequences if journal_key(sequence) not in entries]
+            # A writer may have taken a sequence number without storing its entry yet;
+            # stop in front of it, unless the previous flush already waited for it
+            hole = missing[0] if missing else None
+            if hole is not None and cache.get(JOURNAL_HOLE_KEY) != hole:
+                cache.set(JOURNAL_HOLE_KEY, hole, None)
+                sequences = range(sequences.start, hole)
+                last = hole - 1
+            if not sequences:
+                break
+            session_keys = {entries[journal_key(sequence)] for sequence in sequences if sequence not in missing}
+            written += _write_carts(session_keys)
+            cache.delete_many([journal_key(sequence) for sequence in sequences])
+            flushed = sequences[-1]
+            cache.set(JOURNAL_FLUSHED_KEY, flushed, None)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return written
+
+
+def _write_carts(session_keys):
+    carts = cache.get_many([cart_key(session_key) for session_key in session_keys])
+    rows = [
+        Cart(session_key=session_key, items={str(product_id): quantity for product_id, quantity in items.items()})
+        for session_key in session_keys
+        if (items := carts.get(cart_key(session_key))) is not None
+    ]
+    Cart.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['session_key'], update_fields=['items', 'updated_at']
+    )
+    return len(rows)
@@ -0,0 +1,347 @@
+"""
+Bulk catalog import and export as CSV or JSON Lines.
+
+Both directions stream: import reads and writes batch_size rows at a time and
+export walks the products with a chunked iterator, so memory stays flat for
+files of any size. Rows are keyed by product id; a row without an id creates
+a product. Categories are matched by name and created when missing. A row's
+images, when given, replace the product's images: URLs already attached are
+updated in place, new ones inserted and the rest deleted, and the first image
+becomes the primary.
+
+On PostgreSQL with psycopg2 the products of each batch are COPYed into a
+staging table and upserted from there in one statement; elsewhere they go
+through bulk_create(update_conflicts=True). The bulk writes skip model
+signals, so the search index, facet cells and catalog cache are brought up
+to date here.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from . import derivatives, facets, search
+from .cache import invalidate_catalog
+from .models import Category, Product, ProductImage
+
+FORMATS = ('csv', 'jsonl')
+PRODUCT_FIELDS = (
+    'name', 'description', 'price', 'category_id', 'in_stock', 'stock_quantity', 'featured', 'discount',
+    'size', 'flavour', 'image',
+)
+COLUMNS = (
+    'id', 'name', 'description', 'price', 'category', 'in_stock', 'stock_quantity', 'featured', 'discount',
+    'size', 'flavour', 'image', 'images',
+)
+STAGING_TABLE = 'catalog_import_staging'
+# COPY's NULL marker; only an unquoted \N is NULL, so every value is quoted
+COPY_NULL = r'\N'
+
+
+def format_for(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Import
+
+def read_rows(stream, fmt):
+    """Yield (line number, raw row dict) from a CSV or JSON Lines stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as exc:
+                    raise ValueError(f"line {line_number}: {exc}")
+
+
+def _optional(value):
+    return None if value is None or value == '' else value
+
+
+def _flag(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    parsed = facets.parse_bool(str(value))
+    if parsed is None:
+        raise ValueError(f"not a boolean: {value!r}")
+    return parsed
+
+
+def _images(value):
+    if value is None or value == '':
+        # Images left out: keep the product's current images
+        return None if value is None else []
+    if isinstance(value, str):
+        value = value.split()
+    return [
+        {'image': image, 'alt_text': ''} if isinstance(image, str)
+        else {'image': image['image'], 'alt_text': image.get('alt_text') or ''}
+        for image in value
+    ]
+
+
+def parse_row(line_number, raw):
+    """The typed product row for one file row; ValueError names the offending line"""
+    try:
+        name = raw.get('name') or ''
+        category = raw.get('category') or ''
+        if not name or not category:
+            raise ValueError("name and category are required")
+        try:
+            price = Decimal(str(raw['price'])).quantize(Decimal('0.01'))
+        except (KeyError, InvalidOperation):
+            raise ValueError(f"invalid price: {raw.get('price')!r}")
+        pk = _optional(raw.get('id'))
+        stock_quantity = _optional(raw.get('stock_quantity'))
+        stock_quantity = None if stock_quantity is None else int(stock_quantity)
+        if stock_quantity is not None and stock_quantity < 0:
+            raise ValueError("stock_quantity can't be negative")
+        discount = _optional(raw.get('discount'))
+        return {
+            'id': None if pk is None else int(pk),
+            'name': name,
+            'description': raw.get('description') or '',
+            'price': price,
+            'category': category,
+            'in_stock': stock_quantity > 0 if stock_quantity is not None else _flag(raw.get('in_stock'), True),
+            'stock_quantity': stock_quantity,
+            'featured': _flag(raw.get('featured'), False),
+            'discount': Product._meta.get_field('discount').default if discount is None else float(discount),
+            'size': _optional(raw.get('size')),
+            'flavour': _optional(raw.get('flavour')),
+            'image': _optional(raw.get('image')),
+            'images': _images(raw.get('images')),
+        }
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"line {line_number}: {exc}")
+
+
+def _category_ids(rows, known):
+    """Fill ``known`` ({name: id}) with the batch's categories, creating missing ones"""
+    names = {row['category'] for row in rows} - known.keys()
+    if names:
+        known.update(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = names - known.keys()
+        known.update(
+            (category.name, category.pk)
+            for category in Category.objects.bulk_create([Category(name=name) for name in sorted(missing)])
+        )
+
+
+def _upsert_products_orm(rows):
+    products = [
+        Product(pk=row['id'], **{field: row[field] for field in PRODUCT_FIELDS})
+        for row in rows
+    ]
+    existing = [product for product in products if product.pk is not None]
+    Product.objects.bulk_create(
+        existing, update_conflicts=True, unique_fields=['id'], update_fields=list(PRODUCT_FIELDS)
+    )
+    if existing:
+        # Explicit ids don't advance the id sequence; move it past them before
+        # this batch's and later batches' new products take ids from it
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                cursor.execute(sql)
+    Product.objects.bulk_create([product for product in products if product.pk is None])
+    for row, product in zip(rows, products):
+        row['id'] = product.pk
+
+
+def copy_available():
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return not is_psycopg3
+
+
+def _create_staging_table():
+    columns = ', '.join(('id',) + PRODUCT_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+        cursor.execute(f'CREATE TEMPORARY TABLE {STAGING_TABLE} AS SELECT {columns} FROM main_product WITH NO DATA')
+
+
+def _copy_value(value):
+    """``value`` as a COPY csv field: quoted, so a literal \\N or empty string isn't read as NULL"""
+    if value is None:
+        return COPY_NULL
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _upsert_products_copy(rows):
+    columns = ('id',) + PRODUCT_FIELDS
+    with connection.cursor() as cursor:
+        missing = [row for row in rows if row['id'] is None]
+        explicit = [row['id'] for row in rows if row['id'] is not None]
+        if explicit:
+            # Explicit ids don't advance the id sequence; move it past them, never back
+            cursor.execute("""
+                SELECT setval(seq, GREATEST(%s, COALESCE(pg_sequence_last_value(seq), 1),
+                                            (SELECT COALESCE(MAX(id), 1) FROM main_product)))
+                FROM (SELECT pg_get_serial_sequence('main_product', 'id')::regclass AS seq) AS product_sequence
+            """, [max(explicit)])
+        if missing:
+            # Take ids up front so every staged row has one to upsert and attach images to
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence('main_product', 'id')) FROM generate_series(1, %s)",
+                [len(missing)]
+            )
+            for row, (pk,) in zip(missing, cursor.fetchall()):
+                row['id'] = pk
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(_copy_value(row[column]) for column in columns) + '\n')
+        buffer.seek(0)
+
+        cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer
+        )
+        updates = ', '.join(f'{field} = EXCLUDED.{field}' for field in PRODUCT_FIELDS)
+        cursor.execute(f"""
+            INSERT INTO main_product ({', '.join(columns)}, created_at)
+            SELECT {', '.join(columns)}, now() FROM {STAGING_TABLE}
+            ON CONFLICT (id) DO UPDATE SET {updates}
+        """)
+
+
+def _replace_images(rows):
+    wanted = {}
+    for row in rows:
+        if row['images'] is not None:
+            images = wanted.setdefault(row['id'], {})
+            for image in row['images']:
+                images.setdefault(image['image'], image['alt_text'])
+    if not wanted:
+        return
+
+    images = ProductImage.objects.filter(product_id__in=wanted)
+    current, stale = {}, []
+    for image in images.only('id', 'product_id', 'image'):
+        if image.image in wanted[image.product_id] and (image.product_id, image.image) not in current:
+            current[image.product_id, image.image] = image
+        else:
+            stale.append(image.pk)
+    images.filter(pk__in=stale).delete()
+    # Clear every primary first so productimage_one_primary holds while the new flags are written
+    images.filter(is_primary=True).update(is_primary=False)
+
+    changed, created = [], []
+    for product_id, urls in wanted.items():
+        for order, (url, alt_text) in enumerate(urls.items()):
+            image = current.get((product_id, url)) or ProductImage(product_id=product_id, image=url)
+            image.alt_text, image.order, image.is_primary = alt_text, order, order == 0
+            (created if image.pk is None else changed).append(image)
+    ProductImage.objects.bulk_update(changed, ['alt_text', 'order', 'is_primary'])
+    ProductImage.objects.bulk_create(created)
+    # Images are matched by URL, so only the new ones need variants
+    derivatives.queue(created)
+
+
+def _last_row_per_id(batch):
+    # An upsert can't touch the same row twice in one statement
+    rows = {}
+    for index, row in enumerate(batch):
+        rows[row['id'] if row['id'] is not None else ('new', index)] = row
+    return list(rows.values())
+
+
+def import_catalog(stream, fmt, batch_size=1000, progress=None):
+    """
+    Upsert the products in ``stream``; returns the number of rows imported.
+
+    ``progress`` is called with the running total after every batch.
+    """
+    use_copy = copy_available()
+    if use_copy:
+        _create_staging_table()
+
+    categories = {}
+    imported = 0
+    rows = (parse_row(line_number, raw) for line_number, raw in read_rows(stream, fmt))
+    for batch in batches(rows, batch_size):
+        imported += len(batch)
+        batch = _last_row_per_id(batch)
+        with transaction.atomic():
+            _category_ids(batch, categories)
+            for row in batch:
+                row['category_id'] = categories[row['category']]
+            if use_copy:
+                _upsert_products_copy(batch)
+            else:
+                _upsert_products_orm(batch)
+            _replace_images(batch)
+            search.index_products({row['id'] for row in batch})
+        if progress:
+            progress(imported)
+
+    if use_copy:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+    facets.rebuild()
+    invalidate_catalog()
+    return imported
+
+
+# Export
+
+def export_rows(chunk_size=2000):
+    """Yield every product as a row dict, reading chunk_size products and their images at a time"""
+    products = Product.objects.order_by('id').values(
+        'id', 'name', 'description', 'price', 'category__name', 'in_stock', 'stock_quantity', 'featured',
+        'discount', 'size', 'flavour', 'image',
+    ).iterator(chunk_size=chunk_size)
+    for chunk in batches(products, chunk_size):
+        images = {}
+        for image in ProductImage.objects.filter(product_id__in=[row['id'] for row in chunk]).order_by(
+            'product_id', 'order', 'created_at'
+        ).values('product_id', 'image', 'alt_text'):
+            images.setdefault(image['product_id'], []).append({'image': image['image'], 'alt_text': image['alt_text']})
+        for row in chunk:
+            row['category'] = row.pop('category__name')
+            row['price'] = str(row['price'])
+            row['images'] = images.get(row['id'], [])
+            yield row
+
+
+def export_catalog(stream, fmt, chunk_size=2000, progress=None):
+    """Write the catalog to ``stream``; returns the number of products written"""
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=COLUMNS)
+        writer.writeheader()
+
+        def write(row):
+            # CSV carries image URLs only, separated by spaces
+            writer.writerow({**row, 'images': ' '.join(image['image'] for image in row['images'])})
+    else:
+        def write(row):
+            stream.write(json.dumps({column: row[column] for column in COLUMNS}) + '\n')
+
+    exported = 0
+    for row in export_rows(chunk_size):
+        write(row)
+        exported += 1
+        if progress and exported % chunk_size == 0:
+            progress(exported)
+    return exported
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from . import cart
+
+
+@register(Tags.caches, deploy=True)
+def check_cart_cache(app_configs, **kwargs):
+    if cart.write_behind():
+        return []
+    return [Warning(
+        "Carts are written to the database on every change because CACHES['default'] "
+        f"({settings.CACHES['default']['BACKEND']}) is per process or culls entries.",
+        hint="Use a shared cache such as Redis to keep cart writes off the database.",
+        id='main.W001',
+    )]
+
+
+@register(Tags.security)
+def check_profile_dir(app_configs, **kwargs):
+    profiles = Path(settings.PROFILE_DIR).resolve()
+    media = Path(settings.MEDIA_ROOT).resolve()
+    if profiles != media and media not in profiles.parents:
+        return []
+    return [Error(
+        f"PROFILE_DIR ({settings.PROFILE_DIR}) is inside MEDIA_ROOT, so request profiles are publicly served.",
+        hint="Store profiles outside MEDIA_ROOT; staff download them from the admin's Request profiles page.",
+        id='main.E001',
+    )]
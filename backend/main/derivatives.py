@@ -0,0 +1,226 @@
+"""
+Resized product image variants.
+
+Each ProductImage is rendered into the IMAGE_DERIVATIVE_SIZES widths in every
+format Pillow can encode here, AVIF and WebP when available plus a JPEG
+fallback. Files are stored under MEDIA_ROOT keyed by the SHA-256 of the source
+bytes, so an image shared by several products, or regenerated without
+changing, is encoded once. A manifest next to the files records what was
+rendered, which makes a repeat render a cache hit.
+
+New and changed images are rendered by the process_outbox worker
+('image.derivatives' messages). `manage.py generate_image_derivatives` renders
+in bulk on a pool of processes; rendering is CPU bound and the workers never
+touch the database.
+"""
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.fields.json import KT
+from PIL import Image, ImageOps, features
+
+from .cache import invalidate_catalog
+from .models import IMAGE_DERIVATIVES_TOPIC, OutboxMessage, ProductImage
+
+logger = logging.getLogger(__name__)
+
+TOPIC = IMAGE_DERIVATIVES_TOPIC
+DIRECTORY = 'derivatives'
+MANIFEST = 'manifest.json'
+MEDIA_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def available_formats():
+    """Output formats in order of preference; JPEG is always last"""
+    return [fmt for fmt in ('avif', 'webp') if features.check(fmt)] + ['jpeg']
+
+
+def derivative_name(content_hash, size, fmt):
+    return f'{DIRECTORY}/{content_hash[:2]}/{content_hash}/{size}.{EXTENSIONS[fmt]}'
+
+
+def fetch(url):
+    """The source bytes of an image URL, or of a MEDIA_URL path under MEDIA_ROOT"""
+    limit = settings.IMAGE_DERIVATIVE_MAX_BYTES
+    if url.startswith(('http://', 'https://')):
+        request = Request(url, headers={'User-Agent': 'ecommerce-derivatives'})
+        with urlopen(request, timeout=settings.IMAGE_DERIVATIVE_FETCH_TIMEOUT) as response:
+            data = response.read(limit + 1)
+    elif url.startswith(settings.MEDIA_URL):
+        root = Path(settings.MEDIA_ROOT).resolve()
+        path = (root / url[len(settings.MEDIA_URL):]).resolve()
+        if root not in path.parents:
+            raise ValueError(f"{url} is outside MEDIA_ROOT")
+        with open(path, 'rb') as file:
+            data = file.read(limit + 1)
+    else:
+        raise ValueError(f"Can't fetch {url}")
+    if len(data) > limit:
+        raise ValueError(f"{url} is larger than {limit} bytes")
+    return data
+
+
+def _write(path, encode):
+    # Write to a temporary name and rename, so readers never see a partial file
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}')
+    with open(temporary, 'wb') as file:
+        encode(file)
+    os.replace(temporary, path)
+
+
+def _encode(image, fmt, file):
+    quality = settings.IMAGE_DERIVATIVE_QUALITY
+    if fmt == 'jpeg':
+        if image.mode != 'RGB':
+            # JPEG has no alpha channel: flatten onto white
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        image.save(file, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        image.save(file, 'WEBP', quality=quality, method=4)
+    else:
+        # Speed 8 encodes about 3x faster than the default 6 for slightly larger files
+        image.save(file, 'AVIF', quality=quality, speed=8)
+
+
+def render(data):
+    """
+    Render the variants of the image in ``data``; returns (content hash, sizes),
+    sizes being {size: {'width', 'height', 'formats'}}. Reuses files already
+    rendered for the same bytes.
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    directory = Path(settings.MEDIA_ROOT) / DIRECTORY / content_hash[:2] / content_hash
+    manifest = directory / MANIFEST
+    formats = available_formats()
+    # Rendered files are reused only when they were made with the current settings
+    recipe = {'sizes': settings.IMAGE_DERIVATIVE_SIZES, 'formats': formats,
+              'quality': settings.IMAGE_DERIVATIVE_QUALITY}
+    if manifest.exists():
+        rendered = json.loads(manifest.read_text())
+        if rendered['recipe'] == recipe:
+            return content_hash, rendered['sizes']
+
+    directory.mkdir(parents=True, exist_ok=True)
+    sizes = {}
+    with Image.open(BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)
+        transparent = 'A' in source.getbands() or 'transparency' in source.info
+        source = source.convert('RGBA' if transparent else 'RGB')
+        for size, width in settings.IMAGE_DERIVATIVE_SIZES.items():
+            # Never upscale
+            width = min(width, source.width)
+            height = max(round(source.height * width / source.width), 1)
+            resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                _write(directory / f'{size}.{EXTENSIONS[fmt]}', lambda file: _encode(resized, fmt, file))
+            sizes[size] = {'width': width, 'height': height, 'formats': formats}
+    _write(manifest, lambda file: file.write(json.dumps({'recipe': recipe, 'sizes': sizes}).encode()))
+    return content_hash, sizes
+
+
+def _render_url(url):
+    """Pool task: (content hash, sizes, error)"""
+    try:
+        return (*render(fetch(url)), None)
+    except Exception as exc:
+        return None, None, f"{type(exc).__name__}: {exc}"
+
+
+def variants(image, absolute_url=None):
+    """
+    The 'variants' and 'srcset' representation of a ProductImage (instance or
+    values() dict); both are empty until the derivatives are rendered.
+    """
+    get = image.get if isinstance(image, dict) else lambda field: getattr(image, field)
+    content_hash, derivatives = get('content_hash'), get('derivatives') or {}
+    sizes = derivatives.get('sizes') or {}
+    if not content_hash or not sizes:
+        return {}, {}
+
+    def url(size, fmt):
+        location = settings.MEDIA_URL + derivative_name(content_hash, size, fmt)
+        return absolute_url(location) if absolute_url else location
+
+    by_size = {}
+    srcset = {}
+    for size, info in sizes.items():
+        by_size[size] = {'width': info['width'], 'height': info['height']}
+        for fmt in info['formats']:
+            by_size[size][fmt] = url(size, fmt)
+            srcset.setdefault(MEDIA_TYPES[fmt], []).append(f"{url(size, fmt)} {info['width']}w")
+    return by_size, {media_type: ', '.join(entries) for media_type, entries in srcset.items()}
+
+
+def needs_render(image):
+    return (image.derivatives or {}).get('source') != image.image
+
+
+def queue(images):
+    """Queue the variants of images written with bulk_create, which skips the post_save signal"""
+    OutboxMessage.objects.bulk_create([OutboxMessage(topic=TOPIC, payload={'image_id': image.pk}) for image in images])
+
+
+def stale_images():
+    """Images whose variants were never rendered or were rendered from another URL"""
+    return ProductImage.objects.alias(source=KT('derivatives__source')).filter(
+        Q(source__isnull=True) | ~Q(source=F('image'))
+    )
+
+
+def _save(updates):
+    images = [
+        ProductImage(pk=pk, content_hash=content_hash, derivatives={'source': source, 'sizes': sizes})
+        for pk, source, content_hash, sizes in updates
+    ]
+    ProductImage.objects.bulk_update(images, ['content_hash', 'derivatives'])
+    if images:
+        invalidate_catalog()
+
+
+def render_image(payload):
+    """Outbox handler: render one image in this process"""
+    image = ProductImage.objects.filter(pk=payload['image_id']).only('id', 'image', 'derivatives').first()
+    if image is None or not needs_render(image):
+        return
+    content_hash, sizes = render(fetch(image.image))
+    _save([(image.pk, image.image, content_hash, sizes)])
+
+
+def regenerate(images, workers=None, batch_size=200, progress=None):
+    """
+    Render the derivatives of ``images`` (a ProductImage queryset) on a pool of
+    ``workers`` processes; returns (rendered, failed).
+    """
+    rows = images.order_by('id').values_list('id', 'image')
+    workers = workers or os.cpu_count()
+    rendered = failed = 0
+    # Workers are forked and only fetch and encode; the parent does all database work
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        last_id = 0
+        while batch := list(rows.filter(id__gt=last_id)[:batch_size]):
+            last_id = batch[-1][0]
+            updates = []
+            chunksize = max(len(batch) // (4 * workers), 1)
+            results = pool.map(_render_url, [url for _, url in batch], chunksize=chunksize)
+            for (pk, url), (content_hash, sizes, error) in zip(batch, results):
+                if error:
+                    failed += 1
+                    logger.warning("Image %s (%s) failed: %s", pk, url, error)
+                else:
+                    updates.append((pk, url, content_hash, sizes))
+            _save(updates)
+            rendered += len(updates)
+            if progress:
+                progress(rendered, failed)
+    return rendered, failed
@@ -0,0 +1,126 @@
+"""
+Streaming order export.
+
+Orders are read through a chunked iterator, which is a server-side cursor on
+PostgreSQL, and encoded as CSV or NDJSON a chunk at a time. Memory stays flat
+however many orders match, and the header goes out before the first row is
+read. CSV cells that a spreadsheet would run as a formula are prefixed with
+a quote. Under ASGI, Django drains a sync iterator into a list before sending
+anything, so the view streams aexport_orders() there instead.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Order
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+COLUMNS = (
+    'id', 'created_at', 'status', 'customer_name', 'customer_email', 'customer_phone', 'customer_address',
+    'total_amount', 'order_items',
+)
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """A file-like object whose write() hands back what it was given, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _moment(value, end_of_day=False):
+    day = parse_date(value)
+    if day is not None:
+        # A bare date covers the whole day
+        moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_filters(query_params):
+    """The export's Order filters from ``created_after``, ``created_before`` and ``status``, or (None, errors)"""
+    filters, errors = {}, {}
+    for param, lookup, end_of_day in (('created_after', 'created_at__gte', False),
+                                      ('created_before', 'created_at__lt', True)):
+        value = query_params.get(param)
+        if value:
+            try:
+                moment = _moment(value, end_of_day)
+            except ValueError:
+                moment = None
+            if moment is None:
+                errors[param] = ['Enter a date or an ISO 8601 date and time.']
+            else:
+                filters[lookup] = moment
+    statuses = [value for raw in query_params.getlist('status') for value in raw.split(',') if value]
+    if statuses:
+        filters['status__in'] = statuses
+    return (None, errors) if errors else (filters, {})
+
+
+def _cell(value):
+    """``value`` made safe to open in a spreadsheet: customer text can't start a formula"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _row(order):
+    return {
+        **order,
+        'created_at': order['created_at'].isoformat(),
+        'total_amount': str(order['total_amount']),
+    }
+
+
+def export_orders(filters, fmt, chunk_size=None):
+    """Yield the matching orders, oldest first, as CSV or NDJSON byte chunks"""
+    chunk_size = chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE
+    orders = Order.objects.filter(**filters).order_by('id').values(*COLUMNS).iterator(chunk_size=chunk_size)
+
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(COLUMNS).encode()
+
+        def encode(order):
+            row = _row(order)
+            row['order_items'] = json.dumps(row['order_items'])
+            return writer.writerow([_cell(row[column]) for column in COLUMNS])
+    else:
+        def encode(order):
+            return json.dumps(_row(order)) + '\n'
+
+    lines = []
+    for order in orders:
+        lines.append(encode(order))
+        if len(lines) == chunk_size:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+async def aexport_orders(filters, fmt, chunk_size=None):
+    """export_orders() as an async iterator; each chunk is read and encoded in the request's sync thread"""
+    chunks = export_orders(filters, fmt, chunk_size)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,216 @@
+"""
+Faceted product filtering.
+
+ProductFacetCell holds one row per combination of category, featured, in_stock,
+size, flavour and price bucket with the number of products in it. The cells are
+adjusted incrementally from Product signals, so facet counts under any filter
+come from a single scan of the (small) cell table instead of a GROUP BY per
+facet over the products.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Product, ProductFacetCell
+
+CELL_FIELDS = ('category_id', 'featured', 'in_stock', 'size', 'flavour', 'price_bucket')
+FACETS = ('category', 'size', 'flavour', 'price', 'in_stock')
+TRUE_VALUES = {'', '1', 'true', 'yes'}
+FALSE_VALUES = {'0', 'false', 'no'}
+
+
+def price_bounds():
+    return settings.FACET_PRICE_BUCKETS
+
+
+def price_bucket(price):
+    return max(bisect_right(price_bounds(), Decimal(str(price))) - 1, 0)
+
+
+def price_bucket_label(bucket):
+    bounds = price_bounds()
+    upper = bounds[bucket + 1] if bucket + 1 < len(bounds) else ''
+    return f'{bounds[bucket]}-{upper}'
+
+
+def cell_key(product):
+    """The cell a product (instance or values() dict) is counted in"""
+    get = product.get if isinstance(product, dict) else lambda field: getattr(product, field)
+    return (
+        get('category_id'),
+        get('featured'),
+        get('in_stock'),
+        get('size') or '',
+        get('flavour') or '',
+        price_bucket(get('price')),
+    )
+
+
+def adjust_cell(key, delta):
+    cells = ProductFacetCell.objects.filter(**dict(zip(CELL_FIELDS, key)))
+    if cells.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            ProductFacetCell.objects.create(count=delta, **dict(zip(CELL_FIELDS, key)))
+    except IntegrityError:
+        # Another writer created the cell first
+        cells.update(count=F('count') + delta)
+
+
+def move_product(old_key, new_key):
+    if old_key != new_key:
+        if old_key is not None:
+            adjust_cell(old_key, -1)
+        if new_key is not None:
+            adjust_cell(new_key, 1)
+
+
+def price_bucket_expression():
+    bounds = price_bounds()
+    whens = [When(price__lt=upper, then=Value(bucket)) for bucket, upper in enumerate(bounds[1:])]
+    return Case(*whens, default=Value(len(bounds) - 1))
+
+
+def count_cells(products):
+    """Aggregate a Product queryset into {cell key: count}"""
+    rows = products.order_by().annotate(
+        price_bucket=price_bucket_expression(),
+        size_value=Coalesce('size', Value('')),
+        flavour_value=Coalesce('flavour', Value('')),
+    ).values(
+        'category_id', 'featured', 'in_stock', 'size_value', 'flavour_value', 'price_bucket'
+    ).annotate(count=Count('id'))
+    return {
+        (row['category_id'], row['featured'], row['in_stock'], row['size_value'], row['flavour_value'],
+         row['price_bucket']): row['count']
+        for row in rows
+    }
+
+
+def rebuild():
+    """Recount every cell from scratch; used after bulk writes that skip signals"""
+    with transaction.atomic():
+        ProductFacetCell.objects.all().delete()
+        ProductFacetCell.objects.bulk_create([
+            ProductFacetCell(count=count, **dict(zip(CELL_FIELDS, key)))
+            for key, count in count_cells(Product.objects.all()).items()
+        ])
+
+
+def parse_bool(value):
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return None
+
+
+def _values(query_params, name):
+    return [value for raw in query_params.getlist(name) for value in raw.split(',') if value]
+
+
+def parse_filters(query_params):
+    """Read the facet filters from query parameters, ignoring malformed values"""
+    filters = {}
+    categories = [int(value) for value in _values(query_params, 'category') if value.isdigit()]
+    if categories:
+        filters['category'] = set(categories)
+    for facet in ('size', 'flavour'):
+        values = _values(query_params, facet)
+        if values:
+            filters[facet] = set(values)
+    labels = {price_bucket_label(bucket): bucket for bucket in range(len(price_bounds()))}
+    buckets = {labels[value] for value in _values(query_params, 'price') if value in labels}
+    if buckets:
+        filters['price'] = buckets
+    for flag in ('in_stock', 'featured'):
+        value = query_params.get(flag)
+        if value is not None and parse_bool(value) is not None:
+            filters[flag] = parse_bool(value)
+    return filters
+
+
+def filter_products(queryset, filters):
+    if 'category' in filters:
+        queryset = queryset.filter(category_id__in=filters['category'])
+    if 'size' in filters:
+        queryset = queryset.filter(size__in=filters['size'])
+    if 'flavour' in filters:
+        queryset = queryset.filter(flavour__in=filters['flavour'])
+    if 'price' in filters:
+        bounds = price_bounds()
+        price_q = Q()
+        for bucket in filters['price']:
+            bucket_q = Q(price__gte=bounds[bucket])
+            if bucket + 1 < len(bounds):
+                bucket_q &= Q(price__lt=bounds[bucket + 1])
+            price_q |= bucket_q
+        queryset = queryset.filter(price_q)
+    for flag in ('in_stock', 'featured'):
+        if flag in filters:
+            queryset = queryset.filter(**{flag: filters[flag]})
+    return queryset
+
+
+def _cell_matches(cell, filters, skip=None):
+    checks = {
+        'category': cell['category_id'],
+        'size': cell['size'],
+        'flavour': cell['flavour'],
+        'price': cell['price_bucket'],
+    }
+    for facet, value in checks.items():
+        if facet != skip and facet in filters and value not in filters[facet]:
+            return False
+    for flag in ('in_stock', 'featured'):
+        if flag != skip and flag in filters and cell[flag] != filters[flag]:
+            return False
+    return True
+
+
+def facet_counts(filters):
+    """
+    Count products per facet value under the current filters.
+
+    Each facet is counted with every filter applied except its own, so the
+    shopper sees how many products selecting another value would return.
+    """
+    cells = ProductFacetCell.objects.filter(count__gt=0).values(*CELL_FIELDS, 'count', 'category__name')
+    counts = {facet: defaultdict(int) for facet in FACETS}
+    category_names = {}
+    for cell in cells:
+        category_names[cell['category_id']] = cell['category__name']
+        values = {
+            'category': cell['category_id'],
+            'size': cell['size'],
+            'flavour': cell['flavour'],
+            'price': cell['price_bucket'],
+            'in_stock': cell['in_stock'],
+        }
+        for facet, value in values.items():
+            if value != '' and _cell_matches(cell, filters, skip=facet):
+                counts[facet][value] += cell['count']
+
+    return {
+        'category': sorted(
+            ({'value': pk, 'label': category_names[pk], 'count': count} for pk, count in counts['category'].items()),
+            key=lambda item: item['label']
+        ),
+        'size': [{'value': value, 'count': count} for value, count in sorted(counts['size'].items())],
+        'flavour': [{'value': value, 'count': count} for value, count in sorted(counts['flavour'].items())],
+        'price': [
+            {'value': price_bucket_label(bucket), 'count': count}
+            for bucket, count in sorted(counts['price'].items())
+        ],
+        'in_stock': [
+            {'value': value, 'count': count}
+            for value, count in sorted(counts['in_stock'].items(), reverse=True)
+        ],
+    }
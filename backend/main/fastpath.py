@@ -0,0 +1,159 @@
+"""
+Read-only fast path for catalog lists.
+
+Builds the exact dictionaries ProductSerializer and CategorySerializer produce,
+straight from values() rows, so large lists skip the per-object field machinery
+and model instantiation. Output must stay identical to the serializers;
+FastPathParityTest enforces that.
+"""
+from collections import defaultdict
+
+from django.utils.encoding import iri_to_uri
+
+from . import derivatives
+from .models import ProductImage
+from .serializers import ProductSerializer
+
+CATEGORY_COLUMNS = ('id', 'name')
+IMAGE_COLUMNS = ('id', 'product_id', 'image', 'is_primary', 'alt_text', 'order', 'content_hash', 'derivatives')
+# values() names for the product columns each serializer field reads
+PRODUCT_COLUMNS = {
+    'category': ['category_id'],
+    'category_name': ['category__name'],
+    'images': ['image'],
+    'primary_image': ['image'],
+}
+# Always selected: the primary key plus the keyset pagination ordering columns
+BASE_COLUMNS = ['id', 'name', 'created_at']
+
+
+class AbsoluteURLBuilder:
+    """request.build_absolute_uri() with the scheme and host resolved once per request"""
+
+    def __init__(self, request):
+        self.request = request
+        self.scheme_host = request.build_absolute_uri('/')[:-1]
+
+    def __call__(self, location):
+        # The same shortcut HttpRequest.build_absolute_uri() takes; anything else goes through it
+        if (
+            location.startswith('/')
+            and not location.startswith('//')
+            and '/./' not in location
+            and '/../' not in location
+        ):
+            return iri_to_uri(self.scheme_host + location)
+        return self.request.build_absolute_uri(location)
+
+
+def product_columns(fields):
+    columns = list(BASE_COLUMNS)
+    for name in fields:
+        for column in PRODUCT_COLUMNS.get(name, [name]):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def product_values(queryset, fields):
+    """A values() queryset with the columns needed to build ``fields``"""
+    return queryset.values(*product_columns(fields))
+
+
+def _image_dict(row, absolute_url):
+    image = row['image']
+    # Mirrors ProductImageSerializer.to_representation
+    if image and 'http' not in image:
+        image = absolute_url(image)
+    variants, srcset = derivatives.variants(row, absolute_url)
+    return {
+        'id': row['id'],
+        'image': image,
+        'is_primary': row['is_primary'],
+        'alt_text': row['alt_text'],
+        'order': row['order'],
+        'variants': variants,
+        'srcset': srcset,
+    }
+
+
+def _legacy_image(row, absolute_url):
+    # Mirrors ProductSerializer._get_absolute_url
+    url = row['image']
+    if not url.startswith(('http://', 'https://')):
+        url = absolute_url(url)
+    return {
+        'id': 0, 'image': url, 'is_primary': True, 'alt_text': row['name'], 'order': 0, 'variants': {}, 'srcset': {}
+    }
+
+
+def image_values(product_ids, fields):
+    """A values() queryset of the images ``fields`` render, or None when they render none"""
+    if 'images' not in fields and 'primary_image' not in fields:
+        return None
+    # All of them even for primary_image alone, which falls back to the first image
+    images = ProductImage.objects.filter(product_id__in=product_ids)
+    return images.order_by('order', 'created_at').values(*IMAGE_COLUMNS)
+
+
+def group_images(image_rows):
+    grouped = defaultdict(list)
+    for row in image_rows:
+        grouped[row['product_id']].append(row)
+    return grouped
+
+
+def build_products(rows, fields, request, image_rows=None):
+    """
+    ProductSerializer(..., many=True).data for values() rows.
+
+    ``image_rows`` lets async callers pass in the image_values() rows they
+    fetched themselves; otherwise they are queried here.
+    """
+    absolute_url = AbsoluteURLBuilder(request)
+    price_field = ProductSerializer().fields['price']
+    if image_rows is None:
+        image_rows = image_values([row['id'] for row in rows], fields) or []
+    images = group_images(image_rows)
+
+    def optional_str(value):
+        return None if value is None else str(value)
+
+    converters = {
+        'id': lambda row: row['id'],
+        'name': lambda row: row['name'],
+        'description': lambda row: row['description'],
+        'price': lambda row: price_field.to_representation(row['price']),
+        'category': lambda row: row['category_id'],
+        'category_name': lambda row: row['category__name'],
+        'in_stock': lambda row: row['in_stock'],
+        'featured': lambda row: row['featured'],
+        'discount': lambda row: float(row['discount']),
+        'size': lambda row: optional_str(row['size']),
+        'flavour': lambda row: optional_str(row['flavour']),
+    }
+
+    def build_images(row):
+        product_images = images.get(row['id'])
+        if not product_images and row['image']:
+            return [_legacy_image(row, absolute_url)]
+        return [_image_dict(image, absolute_url) for image in product_images or []]
+
+    def build_primary_image(row):
+        product_images = images.get(row['id'])
+        if product_images:
+            primary = next((image for image in product_images if image['is_primary']), product_images[0])
+            return _image_dict(primary, absolute_url)
+        if row['image']:
+            return _legacy_image(row, absolute_url)
+        return None
+
+    converters['images'] = build_images
+    converters['primary_image'] = build_primary_image
+    steps = [(name, converters[name]) for name in fields]
+    return [{name: convert(row) for name, convert in steps} for row in rows]
+
+
+def build_categories(rows):
+    """CategorySerializer(..., many=True).data for values() rows"""
+    return [{'id': row['id'], 'name': row['name']} for row in rows]
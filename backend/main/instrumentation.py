@@ -0,0 +1,285 @@
+"""
+Per-request SQL and latency instrumentation.
+
+RequestMetricsMiddleware times every request and splits its wall time into
+SQL (from a database execute wrapper), the view's own work outside SQL,
+which for these endpoints is mostly serialization, and response rendering.
+The split is sent back as a Server-Timing header. Requests slower than
+SLOW_REQUEST_MS are logged as one JSON line with their SLOW_REQUEST_STATEMENTS
+slowest statements. Durations also go into per-endpoint histograms, which the
+staff-only /api/metrics/ endpoint exposes in the Prometheus text format.
+
+A streaming response's body is produced after the middleware returns, so its
+Server-Timing header reports the time to headers, and the histograms and slow
+request log take the full duration and SQL once the body is exhausted or the
+response closed.
+
+The histograms live in process memory, so each worker reports its own.
+Turn the whole thing off with REQUEST_METRICS=false.
+"""
+import heapq
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('request_metrics', default=None)
+
+# Histogram upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_DONE = object()
+
+
+class RequestMetrics:
+    __slots__ = ('start', 'queries', 'sql', 'statements', 'view_start', 'view_end', 'sql_at_view_end')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        # Min-heap of the slowest (seconds, sql) seen so far
+        self.statements = []
+        self.view_start = self.view_end = None
+        self.sql_at_view_end = 0.0
+
+
+def time_sql(execute, sql, params, many, context):
+    """Database execute wrapper, installed on every connection, that times statements of measured requests"""
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.sql += elapsed
+        entry = (elapsed, sql)
+        if len(metrics.statements) < settings.SLOW_REQUEST_STATEMENTS:
+            heapq.heappush(metrics.statements, entry)
+        elif metrics.statements and elapsed > metrics.statements[0][0]:
+            heapq.heapreplace(metrics.statements, entry)
+
+
+def install(connection):
+    if settings.REQUEST_METRICS and time_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_sql)
+
+
+class Histograms:
+    """Request duration histograms and SQL totals per (endpoint, method, status class)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, labels, seconds, queries, sql):
+        index = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0,
+                                                'queries': 0, 'sql': 0.0}
+            if index < len(BUCKETS):
+                series['buckets'][index] += 1
+            series['count'] += 1
+            series['sum'] += seconds
+            series['queries'] += queries
+            series['sql'] += sql
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+
+    def exposition(self):
+        """The histograms in the Prometheus text exposition format"""
+        with self.lock:
+            series = {labels: {**values, 'buckets': list(values['buckets'])} for labels, values in self.series.items()}
+        lines = [
+            '# HELP http_request_duration_seconds Request wall time by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for labels, values in sorted(series.items()):
+            label_text = _labels(labels)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values['buckets']):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{label_text},le="+Inf"}} {values["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{{label_text}}} {values["sum"]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{label_text}}} {values["count"]}')
+        for name, key, help_text, fmt in (
+            ('http_request_db_queries_total', 'queries', 'SQL statements run by requests.', '{}'),
+            ('http_request_db_seconds_total', 'sql', 'Time requests spent in SQL.', '{:.6f}'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for labels, values in sorted(series.items()):
+                lines.append(f'{name}{{{_labels(labels)}}} {fmt.format(values[key])}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    endpoint, method, status = labels
+    escaped = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+    return f'endpoint="{escaped}",method="{method}",status="{status}"'
+
+
+histograms = Histograms()
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Async hooks, or Django would run each sync hook in a worker thread
+            self.process_view = self._async_hook(self.process_view)
+            self.process_template_response = self._async_hook(self.process_template_response)
+
+    @staticmethod
+    def _async_hook(hook):
+        async def run(*args):
+            return hook(*args)
+        return run
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current.get()
+        if metrics is not None:
+            metrics.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Called once the view has returned and before the response is rendered
+        metrics = current.get()
+        if metrics is not None:
+            metrics.view_end = time.perf_counter()
+            metrics.sql_at_view_end = metrics.sql
+        return response
+
+    def finish(self, request, response, metrics):
+        end = time.perf_counter()
+        timings = self.timings(metrics, end)
+        if response.streaming:
+            # The body isn't produced yet: the header stops at the headers
+            timings['headers'] = timings.pop('total')
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.2f}' + (f';desc="{metrics.queries} queries"' if name == 'db' else '')
+            for name, seconds in timings.items()
+        )
+        if response.streaming:
+            response.streaming_content = self.measure_stream(request, response, metrics)
+        else:
+            self.record(request, response, metrics, timings)
+        return response
+
+    @staticmethod
+    def timings(metrics, end):
+        timings = {'db': metrics.sql}
+        if metrics.view_start is not None and metrics.view_end is not None:
+            # SQL run while rendering (lazy querysets) is counted under db, not render
+            timings['serialize'] = max(metrics.view_end - metrics.view_start - metrics.sql_at_view_end, 0.0)
+            timings['render'] = max(end - metrics.view_end - (metrics.sql - metrics.sql_at_view_end), 0.0)
+        timings['total'] = end - metrics.start
+        return timings
+
+    def measure_stream(self, request, response, metrics):
+        """Wrap the streamed body so its SQL is counted and the request recorded once it ends"""
+        content = response.streaming_content
+        if response.is_async:
+            async def stream():
+                try:
+                    async for chunk in _metered_async(content, metrics):
+                        yield chunk
+                finally:
+                    self.record(request, response, metrics, self.timings(metrics, time.perf_counter()))
+        else:
+            def stream():
+                try:
+                    yield from _metered(content, metrics)
+                finally:
+                    self.record(request, response, metrics, self.timings(metrics, time.perf_counter()))
+        return stream()
+
+    def record(self, request, response, metrics, timings):
+        total = timings['total']
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.view_name if match else 'unmatched'
+        histograms.observe(
+            (endpoint, request.method, f'{response.status_code // 100}xx'), total, metrics.queries, metrics.sql
+        )
+        if total * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'queries': metrics.queries,
+                **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in timings.items()},
+                'slowest_sql': [
+                    {'ms': round(seconds * 1000, 2), 'sql': sql}
+                    for seconds, sql in sorted(metrics.statements, key=lambda entry: entry[0], reverse=True)
+                ],
+            }))
+
+
+def _metered(chunks, metrics):
+    # Statements run while producing a chunk belong to the request
+    chunks = iter(chunks)
+    while True:
+        token = current.set(metrics)
+        try:
+            chunk = next(chunks, _DONE)
+        finally:
+            current.reset(token)
+        if chunk is _DONE:
+            return
+        yield chunk
+
+
+async def _metered_async(chunks, metrics):
+    # sync_to_async copies the context, so chunks built in a worker thread are counted too
+    chunks = aiter(chunks)
+    while True:
+        token = current.set(metrics)
+        try:
+            chunk = await anext(chunks, _DONE)
+        finally:
+            current.reset(token)
+        if chunk is _DONE:
+            return
+        yield chunk
@@ -0,0 +1,183 @@
+"""
+Stock counters and reservations.
+
+Products with a stock_quantity are sold through reserve(): a single conditional
+UPDATE decrements every line of an order at once, and only where enough stock
+is left, so concurrent buyers can't oversell and no row is read-then-written.
+It runs as the last step of the order transaction, so a hot product's row
+lock is held only for the commit. Group commits hold() the stock in a short
+transaction of its own before the shared one instead, and attach() the
+reservations to the order there.
+
+Each decrement is recorded as a StockReservation. Its stock goes back to the
+product when the order is cancelled, whether or not it was confirmed first
+(see release_order()), and through release_reservations(), which also cancels
+orders still pending after STOCK_RESERVATION_MINUTES unless
+CANCEL_EXPIRED_ORDERS is turned off.
+
+These UPDATEs skip model signals, so facet cells and the catalog cache are
+adjusted here for the products whose in_stock flips.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from . import facets
+from .cache import invalidate_catalog
+from .models import Order, Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+FACET_COLUMNS = ('id', 'category_id', 'featured', 'size', 'flavour', 'price', 'stock_quantity')
+# Reservations whose stock is still taken from the product
+HELD = [StockReservation.ACTIVE, StockReservation.COMMITTED]
+
+
+class InsufficientStock(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _per_product(quantities):
+    return Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+                output_field=IntegerField())
+
+
+def _flip_in_stock(rows, in_stock):
+    """Move products whose in_stock changed to ``in_stock`` into their new facet cells"""
+    for row in rows:
+        facets.move_product(
+            facets.cell_key({**row, 'in_stock': not in_stock}), facets.cell_key({**row, 'in_stock': in_stock})
+        )
+    if rows:
+        invalidate_catalog()
+
+
+def reserve(order, lines):
+    """
+    Take the stock for ``lines`` (the order_items snapshot) or raise InsufficientStock.
+
+    Must run inside the order's transaction so a failure rolls the order back;
+    ``order`` may be None for stock held ahead of the order. Returns the
+    created reservations.
+    """
+    quantities = defaultdict(int)
+    for line in lines:
+        quantities[line['product']] += line['quantity']
+    needed = _per_product(quantities)
+    updated = Product.objects.filter(
+        Q(stock_quantity__isnull=True) | Q(stock_quantity__gte=needed), pk__in=quantities
+    ).update(
+        # Right-hand sides see the row before the update
+        in_stock=Case(
+            When(stock_quantity__isnull=True, then=F('in_stock')),
+            When(stock_quantity__gt=needed, then=Value(True)),
+            default=Value(False),
+        ),
+        stock_quantity=F('stock_quantity') - needed,
+    )
+    rows = list(Product.objects.filter(pk__in=quantities).values(*FACET_COLUMNS, 'name'))
+    if updated != len(quantities):
+        short = [
+            row for row in rows if row['stock_quantity'] is not None and row['stock_quantity'] < quantities[row['id']]
+        ]
+        raise InsufficientStock([
+            f"Only {row['stock_quantity']} of {row['name']} left." if row['stock_quantity']
+            else f"{row['name']} is out of stock."
+            for row in short
+        ] or ["Some products are no longer available."])
+
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    reservations = StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=row['id'], quantity=quantities[row['id']], expires_at=expires_at)
+        for row in rows if row['stock_quantity'] is not None
+    ])
+    _flip_in_stock([row for row in rows if row['stock_quantity'] == 0], in_stock=False)
+    return reservations
+
+
+def hold(lines):
+    """
+    Reserve the stock for ``lines`` in a transaction of its own, before the
+    order exists; returns the reservation ids for attach() or release().
+    Held stock that is never attached is released once it expires.
+    """
+    with transaction.atomic():
+        return [reservation.pk for reservation in reserve(None, lines)]
+
+
+def attach(reservation_ids, order):
+    StockReservation.objects.filter(pk__in=reservation_ids).update(order=order)
+
+
+def release(reservation_ids):
+    """Give back held stock whose order was not created"""
+    with transaction.atomic():
+        _give_back(StockReservation.objects.filter(pk__in=reservation_ids, status=StockReservation.ACTIVE))
+
+
+def release_order(order_id):
+    """Give back the stock of a cancelled order"""
+    with transaction.atomic():
+        return _give_back(StockReservation.objects.filter(order_id=order_id, status__in=HELD))
+
+
+def _give_back(due, limit=None):
+    """Return the stock of the reservations in ``due`` to their products; returns them"""
+    if connection.features.has_select_for_update_skip_locked:
+        due = due.select_for_update(skip_locked=True, of=('self',))
+    reservations = list(due.order_by('expires_at', 'id').values('id', 'order_id', 'product_id', 'quantity')[:limit])
+    if not reservations:
+        return reservations
+
+    quantities = defaultdict(int)
+    for reservation in reservations:
+        quantities[reservation['product_id']] += reservation['quantity']
+    returned = _per_product(quantities)
+    Product.objects.filter(pk__in=quantities).update(
+        in_stock=Case(When(stock_quantity__isnull=True, then=F('in_stock')), default=Value(True)),
+        stock_quantity=F('stock_quantity') + returned,
+    )
+    StockReservation.objects.filter(pk__in=[r['id'] for r in reservations]).update(status=StockReservation.RELEASED)
+    # Products that were sold out before this release are back in stock
+    rows = Product.objects.filter(pk__in=quantities).values(*FACET_COLUMNS)
+    _flip_in_stock([row for row in rows if row['stock_quantity'] == quantities[row['id']]], in_stock=True)
+    return reservations
+
+
+def release_reservations(batch_size=500):
+    """
+    Settle reservations: keep the stock of orders that moved past pending and
+    give back the stock of cancelled orders and of held stock never attached
+    to an order. Unless CANCEL_EXPIRED_ORDERS is off, pending orders whose
+    reservation expired are cancelled and their stock given back too.
+    Returns the number released.
+    """
+    StockReservation.objects.filter(status=StockReservation.ACTIVE).exclude(
+        order__status__in=['pending', 'cancelled']
+    ).exclude(order__isnull=True).update(status=StockReservation.COMMITTED)
+
+    released = 0
+    while True:
+        now = timezone.now()
+        due = Q(order__status='cancelled', status__in=HELD) | Q(
+            order__isnull=True, status=StockReservation.ACTIVE, expires_at__lte=now
+        )
+        if settings.CANCEL_EXPIRED_ORDERS:
+            due |= Q(order__status='pending', status=StockReservation.ACTIVE, expires_at__lte=now)
+        with transaction.atomic():
+            reservations = _give_back(StockReservation.objects.filter(due), batch_size)
+            if not reservations:
+                return released
+            expired = Order.objects.filter(pk__in={r['order_id'] for r in reservations}, status='pending')
+            expired_ids = list(expired.values_list('id', flat=True))
+            if expired_ids:
+                expired.update(status='cancelled')
+                logger.warning("Cancelled pending orders whose stock reservation expired: %s", expired_ids)
+            released += len(reservations)
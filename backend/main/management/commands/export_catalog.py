@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from main import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Write every product with its category and images to a CSV or JSON Lines file ("-" writes stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=catalog_io.FORMATS, help='Defaults from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = catalog_io.format_for(path, options['format'])
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            # Progress goes to stderr so stdout can carry the export
+            exported = catalog_io.export_catalog(
+                stream, fmt, options['chunk_size'], progress=lambda count: self.stderr.write(f'{count} products')
+            )
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        self.stderr.write(self.style.SUCCESS(f'Exported {exported} products'))
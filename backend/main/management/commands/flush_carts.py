@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main import cart
+
+
+class Command(BaseCommand):
+    help = 'Write carts changed in the cache since the last flush to the database'
+
+    def handle(self, *args, **options):
+        written = cart.flush()
+        self.stdout.write(self.style.SUCCESS(f'Flushed {written} carts'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main import derivatives
+from main.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Render the resized WebP/AVIF/JPEG variants of product images on a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Every image, not only new and changed ones; unchanged files are reused')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.all() if options['all'] else derivatives.stale_images()
+        rendered, failed = derivatives.regenerate(
+            images, options['workers'], options['batch_size'],
+            progress=lambda rendered, failed: self.stdout.write(f'{rendered} rendered, {failed} failed'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} images, {failed} failed'))
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Upsert categories, products and images from a CSV or JSON Lines file ("-" reads stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=catalog_io.FORMATS, help='Defaults from the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = catalog_io.format_for(path, options['format'])
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            imported = catalog_io.import_catalog(
+                stream, fmt, options['batch_size'], progress=lambda count: self.stdout.write(f'{count} rows')
+            )
+        except ValueError as exc:
+            # Batches before the bad row stay imported
+            raise CommandError(f'Import stopped at {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} products'))
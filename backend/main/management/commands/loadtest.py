@@ -0,0 +1,138 @@
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import loadgen
+from benchmarks.http import BACKEND_DIR, server, server_env
+
+SERVERS = {
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'core.asgi:application', '--port', '{port}',
+                '--workers', '{workers}', '--log-level', 'warning', '--no-access-log'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', 'core.wsgi:application', '--bind', '127.0.0.1:{port}',
+                 '--workers', '{workers}', '--worker-class', 'gthread', '--threads', '{threads}',
+                 '--log-level', 'warning'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Boot the app under uvicorn or gunicorn on localhost and drive it with an open-loop mix of shoppers '
+        'at one or more target rates; reports throughput, error rate and the latency histogram'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=SERVERS, default='gunicorn')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+        parser.add_argument('--async-views', action='store_true', help='ASYNC_CATALOG_VIEWS=true (uvicorn only)')
+        parser.add_argument('--rps', default='50', help='Target requests per second; several, e.g. 50,100,200, '
+                                                        'ramp up step by step to find the saturation point')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds per step')
+        parser.add_argument('--warmup', type=float, default=3, help='Seconds of load before measuring')
+        parser.add_argument('--mix', type=loadgen.parse_mix, default=loadgen.DEFAULT_MIX, help=(
+            f"Scenario weights, default {','.join(f'{k}={v}' for k, v in loadgen.DEFAULT_MIX.items())}"
+        ))
+        parser.add_argument('--connections', type=int, default=256, help='Open connections at most')
+        parser.add_argument('--timeout', type=float, default=10, help='Seconds before a request counts as failed')
+        parser.add_argument('--products', type=int, default=5000, help='Catalog size of the throwaway database')
+        parser.add_argument('--database-url', help='Use this database instead of a throwaway SQLite file')
+        parser.add_argument('--reseed', action='store_true',
+                            help='Replace the catalog and orders of --database-url with a seeded one')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the catalog cache')
+        parser.add_argument('--max-error-rate', type=float, default=0.01)
+        parser.add_argument('--p99-ms', type=float, help='p99 latency above which a step counts as saturated')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', help='Write the results of every step to this file')
+
+    def handle(self, *args, **options):
+        if options['async_views'] and options['server'] != 'uvicorn':
+            raise CommandError('--async-views needs --server uvicorn')
+        rates = [float(rate) for rate in options['rps'].split(',')]
+
+        with tempfile.TemporaryDirectory() as directory:
+            overrides = {}
+            if options['database_url']:
+                overrides['DATABASE_URL'] = options['database_url']
+            if options['no_cache']:
+                overrides['CACHE_BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
+            if options['async_views']:
+                overrides['ASYNC_CATALOG_VIEWS'] = 'true'
+            # Slow request logging would flood the console once the server saturates
+            overrides['SLOW_REQUEST_MS'] = str(10 ** 9)
+            env = server_env(f'{directory}/loadtest.sqlite3', **overrides)
+
+            def manage(*arguments):
+                subprocess.run([sys.executable, 'manage.py', *arguments], cwd=BACKEND_DIR, env=env, check=True,
+                               stdout=subprocess.DEVNULL)
+
+            manage('migrate', '--verbosity', '0')
+            if not options['database_url'] or options['reseed']:
+                self.stdout.write(f"Seeding {options['products']} products")
+                manage('seed_catalog', '--clear', '--products', str(options['products']),
+                       '--categories', str(max(options['products'] // 100, 5)), '--orders', '0',
+                       '--seed', str(options['seed']))
+
+            command = [
+                part.format(port='{port}', workers=options['workers'], threads=options['threads'])
+                for part in SERVERS[options['server']]
+            ]
+            with server(command, env) as port:
+                steps = asyncio.run(self.load(port, rates, options))
+
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump({'server': options['server'], 'workers': options['workers'], 'steps': steps}, file, indent=2)
+
+    async def load(self, port, rates, options):
+        rng = random.Random(options['seed'])
+        catalog = await loadgen.Catalog.discover(port)
+        shopper = loadgen.Shopper(catalog, options['mix'], rng)
+        if options['warmup']:
+            await loadgen.run_step(port, shopper, rates[0], options['warmup'], options['connections'],
+                                   options['timeout'], rng)
+
+        steps = []
+        saturation = None
+        for rate in rates:
+            results, elapsed = await loadgen.run_step(
+                port, shopper, rate, options['duration'], options['connections'], options['timeout'], rng
+            )
+            summary = results.summary(rate, options['duration'], elapsed)
+            summary['saturated'] = loadgen.saturated(summary, options['max_error_rate'], options['p99_ms'])
+            steps.append(summary)
+            self.report(summary)
+            if summary['saturated']:
+                saturation = summary
+                break
+
+        if saturation:
+            self.stdout.write(self.style.WARNING(
+                f"Saturated at {saturation['target_rps']:g} req/s: {saturation['saturated']}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Kept up with {rates[-1]:g} req/s"))
+        return steps
+
+    def report(self, summary):
+        self.stdout.write(
+            f"\n{summary['target_rps']:g} req/s target: {summary['sent']} sent ({summary['offered_rps']} req/s), "
+            f"{summary['completed_rps']} req/s completed, {summary['error_rate']:.2%} errors, "
+            f"{summary['rejected']} rejected (4xx)"
+        )
+        self.stdout.write(f"{'scenario':<10} {'requests':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        scenarios = sorted(summary['scenarios'].items(), key=lambda item: list(loadgen.DEFAULT_MIX).index(item[0]))
+        rows = [('all', {'requests': summary['sent'], **summary})] + scenarios
+        for name, row in rows:
+            latencies = ' '.join(
+                f"{'-' if row[key] is None else row[key]:>8}" for key in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+            )
+            self.stdout.write(f"{name:<10} {row['requests']:>9} {latencies}")
+        errors = {outcome: count for outcome, count in summary['outcomes'].items() if outcome not in ('2xx', '4xx')}
+        if errors:
+            self.stdout.write('errors: ' + ', '.join(f'{count} {outcome}' for outcome, count in errors.items()))
+        self.stdout.write(loadgen.format_histogram(summary['histogram_ms']))
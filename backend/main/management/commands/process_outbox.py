@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending outbox messages (order notifications), retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Drain the due messages and exit')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = outbox.process_batch(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Delivered {sent} messages, {failed} failed')
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
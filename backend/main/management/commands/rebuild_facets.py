@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from main import facets
+from main.models import ProductFacetCell
+
+
+class Command(BaseCommand):
+    help = 'Recount the product facet cells, e.g. after bulk product updates that skip signals'
+
+    def handle(self, *args, **options):
+        facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {ProductFacetCell.objects.count()} facet cells'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main import inventory
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by cancelled orders and expired pending orders; run it every few minutes'
+
+    def handle(self, *args, **options):
+        released = inventory.release_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} stock reservations'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main import seeding
+
+
+class Command(BaseCommand):
+    help = 'Add fake categories, products, images and orders; the same --seed always gives the same data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--images-per-product', type=int, default=2)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help='Delete every order and the catalog first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            seeding.clear()
+        products = seeding.seed(
+            options['categories'], options['products'], options['images_per_product'], options['orders'],
+            seed=options['seed'], batch_size=options['batch_size'],
+            progress=lambda label, count: self.stdout.write(f'{count} {label}'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {max(options['categories'], 1)} categories, {len(products)} products and "
+            f"{options['orders'] if products else 0} orders"
+        ))
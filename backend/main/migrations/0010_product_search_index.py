@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# The full-text index main.search maintains and queries: a weighted tsvector
+# column behind a GIN index on PostgreSQL, an FTS5 shadow table keyed by
+# product id on SQLite. Other databases search with icontains lookups.
+CREATE = {
+    'postgresql': [
+        'ALTER TABLE main_product ADD COLUMN search_vector tsvector',
+        'CREATE INDEX product_search_vector_idx ON main_product USING GIN (search_vector)',
+        """
+        UPDATE main_product p SET search_vector =
+            setweight(to_tsvector('english', p.name), 'A') ||
+            setweight(to_tsvector('english', c.name), 'B') ||
+            setweight(to_tsvector('english', coalesce(p.size, '') || ' ' || coalesce(p.flavour, '')), 'B') ||
+            setweight(to_tsvector('english', p.description), 'C')
+        FROM main_category c
+        WHERE c.id = p.category_id
+        """,
+    ],
+    'sqlite': [
+        """
+        CREATE VIRTUAL TABLE main_product_fts USING fts5(
+            name, description, category, size, flavour,
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        INSERT INTO main_product_fts (rowid, name, description, category, size, flavour)
+        SELECT p.id, p.name, p.description, c.name, coalesce(p.size, ''), coalesce(p.flavour, '')
+        FROM main_product p JOIN main_category c ON c.id = p.category_id
+        """,
+    ],
+}
+DROP = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS product_search_vector_idx',
+        'ALTER TABLE main_product DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TABLE IF EXISTS main_product_fts',
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for statement in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in DROP.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def build_facet_cells(apps, schema_editor):
+    """Count the existing products into their cells, as main.facets.rebuild() does"""
+    Product = apps.get_model('main', 'Product')
+    ProductFacetCell = apps.get_model('main', 'ProductFacetCell')
+    bounds = settings.FACET_PRICE_BUCKETS
+    price_bucket = models.Case(
+        *[models.When(price__lt=upper, then=models.Value(bucket)) for bucket, upper in enumerate(bounds[1:])],
+        default=models.Value(len(bounds) - 1),
+    )
+    rows = Product.objects.order_by().annotate(
+        bucket=price_bucket,
+        size_value=Coalesce('size', models.Value('')),
+        flavour_value=Coalesce('flavour', models.Value('')),
+    ).values(
+        'category_id', 'featured', 'in_stock', 'size_value', 'flavour_value', 'bucket'
+    ).annotate(total=models.Count('id'))
+    ProductFacetCell.objects.bulk_create([
+        ProductFacetCell(
+            category_id=row['category_id'], featured=row['featured'], in_stock=row['in_stock'],
+            size=row['size_value'], flavour=row['flavour_value'], price_bucket=row['bucket'], count=row['total'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('featured', models.BooleanField()),
+                ('in_stock', models.BooleanField()),
+                ('size', models.CharField(blank=True, max_length=100)),
+                ('flavour', models.CharField(blank=True, max_length=100)),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'featured', 'in_stock', 'size', 'flavour', 'price_bucket'), name='unique_product_facet_cell')],
+            },
+        ),
+        migrations.RunPython(build_facet_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:18
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, transaction
+
+
+def item_rows(OrderItem, order, lines, product_ids):
+    """OrderItem rows for the order_items snapshot ``lines``, skipping malformed ones"""
+    rows = []
+    for line in lines:
+        try:
+            quantity = int(line['quantity'])
+            unit_price = Decimal(str(line['price']))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            continue
+        product_id = line.get('product')
+        rows.append(OrderItem(
+            order=order,
+            product_id=product_id if product_id in product_ids else None,
+            name=str(line.get('name', ''))[:100],
+            quantity=quantity,
+            unit_price=unit_price,
+        ))
+    return rows
+
+
+def backfill_order_items(apps, schema_editor, batch_size=500):
+    """
+    Create OrderItem rows for orders that predate the table.
+
+    Orders are processed in id order, one transaction per batch, starting after
+    the newest order that already has items, so an interrupted run resumes
+    where it stopped.
+    """
+    Order = apps.get_model('main', 'Order')
+    OrderItem = apps.get_model('main', 'OrderItem')
+    Product = apps.get_model('main', 'Product')
+    last_id = OrderItem.objects.order_by('-order_id').values_list('order_id', flat=True).first() or 0
+    while True:
+        orders = list(Order.objects.filter(id__gt=last_id).order_by('id').only('id', 'order_items')[:batch_size])
+        if not orders:
+            return
+        lines = {
+            order.id: [line for line in order.order_items if isinstance(line, dict)]
+            if isinstance(order.order_items, list) else []
+            for order in orders
+        }
+        referenced = {
+            line['product'] for order_lines in lines.values() for line in order_lines
+            if isinstance(line.get('product'), int)
+        }
+        product_ids = set(Product.objects.filter(pk__in=referenced).values_list('id', flat=True))
+        rows = [row for order in orders for row in item_rows(OrderItem, order, lines[order.id], product_ids)]
+        with transaction.atomic():
+            OrderItem.objects.bulk_create(rows, batch_size=batch_size)
+        last_id = orders[-1].id
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own, so an interrupted run resumes where it stopped
+    atomic = False
+
+    dependencies = [
+        ('main', '0012_orderitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Case-insensitive prefix indexes for the admin's ^customer_name / ^customer_email
+# searches. Django compiles istartswith to UPPER(column::text) LIKE UPPER(...) on
+# PostgreSQL, which needs an expression index with pattern ops, and to a
+# case-insensitive LIKE on SQLite, which needs a NOCASE index.
+INDEXES = {
+    'postgresql': [
+        'CREATE INDEX order_name_prefix_idx ON main_order (UPPER(customer_name::text) text_pattern_ops)',
+        'CREATE INDEX order_email_prefix_idx ON main_order (UPPER(customer_email::text) text_pattern_ops)',
+    ],
+    'sqlite': [
+        'CREATE INDEX order_name_prefix_idx ON main_order (customer_name COLLATE NOCASE)',
+        'CREATE INDEX order_email_prefix_idx ON main_order (customer_email COLLATE NOCASE)',
+    ],
+}
+
+
+def create_prefix_indexes(apps, schema_editor):
+    for statement in INDEXES.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS order_name_prefix_idx')
+        schema_editor.execute('DROP INDEX IF EXISTS order_email_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:30
+
+from django.db import migrations, models
+
+
+def one_primary_per_product(apps, schema_editor):
+    """Leave exactly one primary image on every product that has images, the first in display order"""
+    ProductImage = apps.get_model('main', 'ProductImage')
+    images = ProductImage.objects.order_by('product_id', 'order', 'created_at', 'id')
+
+    primaries = {}
+    for product_id, pk in images.filter(is_primary=True).values_list('product_id', 'id'):
+        primaries.setdefault(product_id, pk)
+    extra = images.filter(is_primary=True).exclude(pk__in=primaries.values()).values_list('id', flat=True)
+    ProductImage.objects.filter(pk__in=list(extra)).update(is_primary=False)
+
+    first = {}
+    for product_id, pk in images.exclude(product_id__in=primaries).values_list('product_id', 'id'):
+        first.setdefault(product_id, pk)
+    ProductImage.objects.filter(pk__in=first.values()).update(is_primary=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_order_prefix_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(one_primary_per_product, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_primary', True)), fields=('product',), name='productimage_one_primary'),
+        ),
+    ]
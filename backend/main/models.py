@@ -1,6 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
+from .cache import invalidate_catalog
+
+# Outbox topic rendering a ProductImage's resized variants (main.derivatives)
+IMAGE_DERIVATIVES_TOPIC = 'image.derivatives'
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -20,18 +25,38 @@ class Product(models.Model):
     image = models.URLField(blank=True, null=True, help_text='Main product image URL (deprecated, use productimage_set)')
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     in_stock = models.BooleanField(default=True)
+    # Units available to sell; null means stock isn't tracked and in_stock is set by hand
+    stock_quantity = models.PositiveIntegerField(
+        blank=True, null=True, help_text='Units available; in_stock follows it when set'
+    )
     featured = models.BooleanField(default=False)
     discount = models.FloatField(default=0.82, help_text='Discount multiplier (e.g., 0.82 for 18% off)')
     created_at = models.DateTimeField(auto_now_add=True)
     size = models.CharField(max_length=100, blank=True, null=True)
     flavour = models.CharField(max_length=100, blank=True, null=True)
-    
+
     class Meta:
         ordering = ['name']  # Default ordering by name
+        indexes = [
+            # Listing and keyset pagination
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            # Storefront filters, each ordered by name
+            models.Index(fields=['category', 'name', 'id'], name='product_category_name_idx'),
+            models.Index(fields=['category', 'featured', 'in_stock', 'name'], name='product_cat_feat_stock_idx'),
+            models.Index(fields=['featured', 'in_stock', 'name'], name='product_feat_stock_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.stock_quantity is not None:
+            self.in_stock = self.stock_quantity > 0
+            if 'update_fields' in kwargs and 'stock_quantity' in kwargs['update_fields']:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'in_stock'}
+        super().save(*args, **kwargs)
+
     @property
     def images(self):
         """Helper method to get all images for this product"""
@@ -43,6 +68,65 @@ class Product(models.Model):
         return self.images.first() or self.image
 
 
+class ProductImageQuerySet(models.QuerySet):
+    def attach(self, product, images):
+        """
+        Append ``images`` (dicts of image, alt_text and is_primary) to ``product``
+        with a single INSERT and return them.
+
+        The first image flagged is_primary replaces the current primary; when
+        none is flagged and the product has no primary yet, the first image is
+        made primary.
+        """
+        images = list(images)
+        with transaction.atomic():
+            current = self.filter(product=product).aggregate(
+                last=models.Max('order'), primaries=models.Count('pk', filter=models.Q(is_primary=True))
+            )
+            primary = next((index for index, image in enumerate(images) if image.get('is_primary')), None)
+            if primary is not None and current['primaries']:
+                self.filter(product=product, is_primary=True).update(is_primary=False)
+            elif primary is None and not current['primaries']:
+                primary = 0
+            start = 0 if current['last'] is None else current['last'] + 1
+            created = self.bulk_create([
+                ProductImage(
+                    product=product,
+                    image=image['image'],
+                    alt_text=image.get('alt_text', ''),
+                    order=start + index,
+                    is_primary=index == primary,
+                )
+                for index, image in enumerate(images)
+            ])
+            # bulk_create and update() skip the post_save signals that invalidate the
+            # catalog and queue the resized variants
+            invalidate_catalog()
+            OutboxMessage.objects.bulk_create([
+                OutboxMessage(topic=IMAGE_DERIVATIVES_TOPIC, payload={'image_id': image.pk}) for image in created
+            ])
+        return created
+
+    def reorder(self, product, image_ids, primary=None):
+        """Number ``product``'s images in the order of ``image_ids``, optionally moving the primary flag"""
+        with transaction.atomic():
+            images = self.filter(product=product)
+            changes = {'order': models.Case(
+                *[models.When(pk=pk, then=models.Value(index)) for index, pk in enumerate(image_ids)],
+                default=models.F('order'),
+                output_field=models.PositiveIntegerField(),
+            )}
+            if primary is not None:
+                # The partial unique index can't be deferred, and PostgreSQL checks it
+                # row by row, so the old primary is cleared before the new one is set
+                images.filter(is_primary=True).exclude(pk=primary).update(is_primary=False)
+                changes['is_primary'] = models.Case(
+                    models.When(pk=primary, then=models.Value(True)), default=models.F('is_primary')
+                )
+            images.filter(pk__in=image_ids).update(**changes)
+            invalidate_catalog()
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     image = models.URLField(help_text='URL of the product image')
@@ -50,28 +134,70 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=255, blank=True, help_text='Alt text for accessibility')
     order = models.PositiveIntegerField(default=0, help_text='Order in which images should be displayed')
     created_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 of the source image and the resized variants rendered from it (main.derivatives)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = ProductImageQuerySet.as_manager()
 
     class Meta:
         ordering = ['order', 'created_at']
+        indexes = [
+            models.Index(fields=['product', 'order', 'created_at'], name='productimage_product_order_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product'], condition=models.Q(is_primary=True), name='productimage_one_primary'
+            ),
+        ]
         verbose_name = 'Product Image'
         verbose_name_plural = 'Product Images'
 
     def __str__(self):
         return f"Image for {self.product.name}"
 
+    def validate_constraints(self, exclude=None):
+        # save() demotes the product's current primary, so forms (the admin's
+        # change form) may pick a new one without tripping productimage_one_primary,
+        # the only constraint on product
+        super().validate_constraints(exclude={*(exclude or ()), 'product'})
+
     def save(self, *args, **kwargs):
         # If this is the first image, make it primary
-        if not self.pk and not ProductImage.objects.filter(product=self.product).exists():
+        if not self.pk and not self.is_primary and not ProductImage.objects.filter(product=self.product).exists():
             self.is_primary = True
-        super().save(*args, **kwargs)
 
-        # If this image is set as primary, ensure no other images are marked as primary
+        # If this image is set as primary, clear the current primary first;
+        # productimage_one_primary allows only one per product
         if self.is_primary:
             ProductImage.objects.filter(
-                product=self.product
+                product=self.product, is_primary=True
             ).exclude(
                 pk=self.pk
             ).update(is_primary=False)
+        super().save(*args, **kwargs)
+
+
+class ProductFacetCell(models.Model):
+    """Number of products in one combination of facet values, maintained by main.facets"""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    featured = models.BooleanField()
+    in_stock = models.BooleanField()
+    size = models.CharField(max_length=100, blank=True)
+    flavour = models.CharField(max_length=100, blank=True)
+    price_bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category', 'featured', 'in_stock', 'size', 'flavour', 'price_bucket'],
+                name='unique_product_facet_cell'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.count} products in {self.category_id}/{self.size}/{self.flavour}/{self.price_bucket}"
 
 
 class Order(models.Model):
@@ -84,22 +210,115 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=50,default='pending')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.customer_name}"
 
     def get_order_text(self):
-        text = f"🛒 *New Order #{self.id}*\n\n"
-        text += f"👤 *Customer:* {self.customer_name}\n"
-        text += f"📧 *Email:* {self.customer_email}\n"
-        text += f"📱 *Phone:* {self.customer_phone}\n"
-        text += f"📍 *Address:* {self.customer_address}\n\n"
-        text += f"🛍️ *Items:*\n"
+        from .notifications import render_order_text
+
+        return render_order_text(self)
+
+
+class OrderItem(models.Model):
+    """One line of an order; Order.order_items keeps the same lines as a JSON snapshot"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # Null for lines backfilled from orders whose product no longer exists
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} x{self.quantity}"
+
+
+class IdempotencyKey(models.Model):
+    """The response to an order request sent with an Idempotency-Key header, replayed on retries"""
+    key = models.CharField(max_length=255, unique=True)
+    # sha256 of the request body; a key reused with another body is rejected
+    fingerprint = models.CharField(max_length=64)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class OutboxMessage(models.Model):
+    """A side effect recorded in the transaction that caused it and delivered by process_outbox"""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
 
-        for item in self.order_items:
-            text += f". {item['name']} x{item['quantity']} - {item['price']}\n"
-        text += f"\n💰 *Total Amount:* ${self.total_amount}\n"
-        text += f"📅 *Order Date:* {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+    class Meta:
+        indexes = [
+            # The worker only ever scans messages that are due
+            models.Index(
+                fields=['available_at', 'id'], condition=models.Q(status='pending'), name='outbox_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.status})"
+
+
+class Cart(models.Model):
+    """Durable copy of a session's cart; main.cart serves carts from the cache and flushes them here"""
+    session_key = models.CharField(max_length=40, unique=True)
+    # {product id: quantity}
+    items = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cart {self.session_key}"
 
-        return text
 
+class StockReservation(models.Model):
+    """
+    Stock taken from a product for an order. Released back to the product when
+    the order is cancelled, see main.inventory. Stock held ahead of a group
+    commit has no order until the order is written.
+    """
+    ACTIVE = 'active'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [(ACTIVE, 'Active'), (COMMITTED, 'Committed'), (RELEASED, 'Released')]
 
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations', null=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['expires_at', 'id'], condition=models.Q(status='active'), name='reservation_active_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id} ({self.status})"
@@ -0,0 +1,57 @@
+"""
+Order notification text and delivery.
+
+ORDER_TEXT is compiled once at import; rendering only walks the node list.
+The order response only links to a short message naming the order and total.
+Delivery runs in the process_outbox worker, never on the request path.
+"""
+import json
+import logging
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template import Context, Engine
+
+logger = logging.getLogger(__name__)
+
+engine = Engine(autoescape=False, libraries={'l10n': 'django.templatetags.l10n'})
+
+ORDER_TEXT = engine.from_string(
+    "{% load l10n %}{% localize off %}"
+    "🛒 *New Order #{{ order.id }}*\n\n"
+    "👤 *Customer:* {{ order.customer_name }}\n"
+    "📧 *Email:* {{ order.customer_email }}\n"
+    "📱 *Phone:* {{ order.customer_phone }}\n"
+    "📍 *Address:* {{ order.customer_address }}\n\n"
+    "🛍️ *Items:*\n"
+    "{% for item in order.order_items %}. {{ item.name }} x{{ item.quantity }} - {{ item.price }}\n{% endfor %}"
+    "\n💰 *Total Amount:* ${{ order.total_amount }}\n"
+    "📅 *Order Date:* {{ order.created_at|date:'Y-m-d H:i' }}"
+    "{% endlocalize %}"
+)
+
+
+def render_order_text(order):
+    return ORDER_TEXT.render(Context({'order': order}, autoescape=False))
+
+
+def render_order_link_text(order):
+    """The short message of the order response's WhatsApp link; the full text goes out through the outbox"""
+    return f"Hi! I just placed order #{order.id} for ${order.total_amount}."
+
+
+def notify_order_created(payload):
+    """Send the new order text to the configured channels; raises on failure so the outbox retries"""
+    from .models import Order
+
+    order = Order.objects.get(pk=payload['order_id'])
+    text = order.get_order_text()
+    if settings.ORDER_NOTIFICATION_EMAILS:
+        send_mail(f"New order #{order.id}", text, None, settings.ORDER_NOTIFICATION_EMAILS)
+    if settings.ORDER_NOTIFICATION_WEBHOOK:
+        body = json.dumps({'order_id': order.id, 'text': text}).encode()
+        request = Request(settings.ORDER_NOTIFICATION_WEBHOOK, data=body, headers={'Content-Type': 'application/json'})
+        with urlopen(request, timeout=10):
+            pass
+    logger.info("Order %s notification sent", order.id)
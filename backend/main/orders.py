@@ -0,0 +1,179 @@
+"""
+Order storage and ingestion.
+
+Orders keep their lines twice: the Order.order_items JSON snapshot the API and
+get_order_text() read, and OrderItem rows for queries across orders.
+
+Requests carrying an Idempotency-Key are recorded in IdempotencyKey in the same
+transaction as the order, so a retry replays the first response instead of
+creating a second order. With ORDER_GROUP_COMMIT on, concurrent submissions
+are written by one leader thread in a single transaction.
+
+Stock is reserved last in the order's transaction, so product row locks are
+held only for the commit. A group commit would hold them for the whole batch,
+so there each order holds its stock in a transaction of its own first.
+"""
+import hashlib
+import json
+import threading
+from decimal import Decimal, InvalidOperation
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import inventory
+from .models import IdempotencyKey, OrderItem
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused with a different request body"""
+
+
+def order_item_rows(order, lines, product_ids):
+    """OrderItem instances for the order_items snapshot ``lines``, skipping malformed ones"""
+    rows = []
+    for line in lines:
+        try:
+            quantity = int(line['quantity'])
+            unit_price = Decimal(str(line['price']))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            continue
+        product_id = line.get('product')
+        rows.append(OrderItem(
+            order=order,
+            product_id=product_id if product_id in product_ids else None,
+            name=str(line.get('name', ''))[:100],
+            quantity=quantity,
+            unit_price=unit_price,
+        ))
+    return rows
+
+
+def create_items(order):
+    """Write the OrderItem rows for a new order, whose lines reference existing products"""
+    product_ids = {line['product'] for line in order.order_items}
+    OrderItem.objects.bulk_create(order_item_rows(order, order.order_items, product_ids))
+
+
+def request_fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def replayed_response(key, fingerprint):
+    """The stored response for an already used key, or None"""
+    record = IdempotencyKey.objects.filter(key=key).values('fingerprint', 'response').first()
+    if record is None:
+        return None
+    if record['fingerprint'] != fingerprint:
+        raise IdempotencyConflict(key)
+    return record['response']
+
+
+def save_order(serializer, build_response, key=None, fingerprint='', held=None):
+    """
+    Save a validated OrderCreateSerializer, record its idempotency key and
+    reserve its stock, or attach the ``held`` reservations from inventory.hold().
+
+    Returns the response body and whether it was replayed: when a concurrent
+    request with the same key committed first, that request's response wins.
+    """
+    try:
+        with transaction.atomic():
+            order = serializer.save()
+            response = build_response(order)
+            if key is not None:
+                IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, order=order, response=response)
+            if held is None:
+                # Last, so the product row locks are held only until the commit
+                inventory.reserve(order, order.order_items)
+            else:
+                inventory.attach(held, order)
+        return response, False
+    except IntegrityError:
+        replay = replayed_response(key, fingerprint) if key is not None else None
+        if replay is None:
+            raise
+        return replay, True
+
+
+class PendingWrite:
+    def __init__(self, work):
+        self.work = work
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """
+    Batches concurrent writes into one transaction.
+
+    The first submitter becomes the leader: it waits up to ORDER_GROUP_COMMIT_WINDOW
+    seconds (less once ORDER_GROUP_COMMIT_MAX_BATCH writes are queued) for others
+    to join, then runs every queued write in its own savepoint inside a single
+    transaction. Followers block until the leader has committed their write.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = []
+        self.collecting = False
+        self.full = threading.Event()
+
+    def submit(self, work):
+        pending = PendingWrite(work)
+        with self.lock:
+            self.queue.append(pending)
+            lead = not self.collecting
+            self.collecting = True
+            if len(self.queue) >= settings.ORDER_GROUP_COMMIT_MAX_BATCH:
+                self.full.set()
+        if lead:
+            self.full.wait(settings.ORDER_GROUP_COMMIT_WINDOW)
+            with self.lock:
+                batch, self.queue = self.queue, []
+                self.collecting = False
+                self.full.clear()
+            self.commit(batch)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def commit(self, batch):
+        try:
+            with transaction.atomic():
+                for pending in batch:
+                    try:
+                        # The savepoint keeps one failed write from aborting the batch
+                        with transaction.atomic():
+                            pending.result = pending.work()
+                    except Exception as exc:
+                        pending.error = exc
+        except Exception as exc:
+            for pending in batch:
+                pending.result, pending.error = None, exc
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+
+group_committer = GroupCommitter()
+
+
+def place_order(serializer, build_response, key=None, fingerprint=''):
+    """save_order() now, or as part of the next group commit when ORDER_GROUP_COMMIT is on"""
+    if not settings.ORDER_GROUP_COMMIT:
+        return save_order(serializer, build_response, key, fingerprint)
+    held = inventory.hold(serializer.validated_data['order_items'])
+    try:
+        response, replayed = group_committer.submit(
+            partial(save_order, serializer, build_response, key, fingerprint, held)
+        )
+    except BaseException:
+        inventory.release(held)
+        raise
+    if replayed:
+        inventory.release(held)
+    return response, replayed
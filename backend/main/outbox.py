@@ -0,0 +1,78 @@
+"""
+Transactional outbox.
+
+enqueue() writes a message inside the caller's transaction, so a message exists
+exactly when the change that produced it committed. The process_outbox command
+delivers due messages in batches: claiming a batch leases it for
+OUTBOX_LEASE_SECONDS, so a crashed worker's messages are picked up again, and
+failures are retried with exponential backoff until OUTBOX_MAX_ATTEMPTS.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import derivatives, notifications
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {
+    'order.created': notifications.notify_order_created,
+    derivatives.TOPIC: derivatives.render_image,
+}
+
+
+def enqueue(topic, payload):
+    return OutboxMessage.objects.create(topic=topic, payload=payload)
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a message that failed ``attempts`` times"""
+    return min(settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboxMessage.objects.filter(status=OutboxMessage.PENDING, available_at__lte=now)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        messages = list(due.order_by('available_at', 'id')[:batch_size])
+        lease_until = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        for message in messages:
+            message.attempts += 1
+            message.available_at = lease_until
+        OutboxMessage.objects.bulk_update(messages, ['attempts', 'available_at'])
+    return messages
+
+
+def deliver(message):
+    handler = HANDLERS.get(message.topic)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for topic {message.topic!r}")
+        handler(message.payload)
+    except Exception as exc:
+        message.last_error = f"{type(exc).__name__}: {exc}"
+        if handler is None or message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.status = OutboxMessage.FAILED
+            logger.error("Outbox message %s failed permanently: %s", message.id, message.last_error)
+        else:
+            message.available_at = timezone.now() + timedelta(seconds=backoff(message.attempts))
+            logger.warning("Outbox message %s failed, retrying: %s", message.id, message.last_error)
+        return False
+    message.status = OutboxMessage.SENT
+    message.sent_at = timezone.now()
+    message.last_error = ''
+    return True
+
+
+def process_batch(batch_size=None):
+    """Deliver one batch of due messages; returns (sent, failed)"""
+    messages = claim_batch(batch_size or settings.OUTBOX_BATCH_SIZE)
+    results = [deliver(message) for message in messages]
+    OutboxMessage.objects.bulk_update(messages, ['status', 'available_at', 'last_error', 'sent_at'])
+    return results.count(True), results.count(False)
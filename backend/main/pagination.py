@@ -0,0 +1,172 @@
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on (ordering field, id).
+
+    Unlike PageNumberPagination it never runs a COUNT(*) or an OFFSET scan, and
+    rows inserted while a client pages through the results never shift a page.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    orderings = {
+        'name': ('name', 'id'),
+        '-name': ('-name', '-id'),
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+    }
+    default_ordering = 'name'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if self.ordering not in self.orderings:
+            self.ordering = self.default_ordering
+        self.model = queryset.model
+
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = bool(cursor and cursor['r'])
+
+        fields = self.orderings[self.ordering]
+        if self.reverse:
+            fields = tuple(self._flip(field) for field in fields)
+        if cursor is not None:
+            queryset = queryset.filter(self._seek_filter(fields, cursor['v']))
+
+        rows = list(queryset.order_by(*fields)[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.page:
+            return None
+        # Going backwards there is always the row we came from after this page
+        if self.reverse or self.has_more:
+            return self.encode_cursor(self.page[-1], reverse=False)
+        return None
+
+    def get_previous_link(self):
+        if not self.page:
+            return None
+        if (self.reverse and self.has_more) or (not self.reverse and self.has_cursor):
+            return self.encode_cursor(self.page[0], reverse=True)
+        return None
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')))
+            if cursor['o'] != self.ordering:
+                raise ValueError
+            field = self.model._meta.get_field(self.orderings[self.ordering][0].lstrip('-'))
+            value, pk = cursor['v']
+            cursor['v'] = (field.to_python(value), int(pk))
+            cursor['r'] = bool(cursor['r'])
+        except (BinasciiError, KeyError, TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, row, reverse):
+        field = self.orderings[self.ordering][0].lstrip('-')
+        value = self._row_value(row, field)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        cursor = {'o': self.ordering, 'v': [value, self._row_value(row, 'id')], 'r': int(reverse)}
+        encoded = b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _seek_filter(self, fields, values):
+        # (field, id) > (value, pk), with a leading range on field so the
+        # database can seek into the composite index instead of scanning it
+        (field, id_field), (value, pk) = fields, values
+        name, op = field.lstrip('-'), 'lt' if field.startswith('-') else 'gt'
+        id_op = 'lt' if id_field.startswith('-') else 'gt'
+        return Q(**{f'{name}__{op}e': value}) & (Q(**{f'{name}__{op}': value}) | Q(**{f'id__{id_op}': pk}))
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _row_value(row, attr):
+        return row[attr] if isinstance(row, dict) else getattr(row, attr)
+
+
+def estimated_count(queryset):
+    """
+    The planner's row estimate for an unfiltered queryset's table, or None.
+
+    PostgreSQL keeps it in pg_class.reltuples and SQLite in sqlite_stat1, both
+    refreshed by ANALYZE (autovacuum on PostgreSQL).
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.combinator or query.is_sliced:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                # The first number of a stat row is the row count of its index, which
+                # for a partial index covers only part of the table; the largest is the table's
+                cursor.execute('SELECT max(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 only exists once ANALYZE has run
+        return None
+    if row is None or row[0] is None:
+        return None
+    estimate = int(row[0])
+    # reltuples is -1 for a table that was never analyzed
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of large tables.
+
+    An unfiltered changelist takes its count from the planner statistics
+    instead of a COUNT(*) over the table once the table holds at least
+    ADMIN_ESTIMATED_COUNT_THRESHOLD rows; filtered and small lists are counted.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
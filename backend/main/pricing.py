@@ -0,0 +1,54 @@
+"""
+Server-side order pricing.
+
+Order lines reference products by id; unit prices come from Product.price and
+Product.discount, never from the client. Every referenced product is loaded in
+one query, so pricing costs the same number of queries for any cart size.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from .models import Product
+
+CENT = Decimal('0.01')
+PRODUCT_COLUMNS = ('id', 'name', 'price', 'discount', 'in_stock', 'stock_quantity')
+
+
+def unit_price(price, discount):
+    # discount is a float multiplier; str() keeps 0.82 from turning into 0.81999...
+    return (Decimal(price) * Decimal(str(discount))).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def price_items(items):
+    """
+    Price ``[{'product': id, 'quantity': n}, ...]``.
+
+    Returns the line snapshots stored on the order and the total, plus a list of
+    problems (unknown or out of stock products); the caller rejects the order
+    when that list is not empty.
+    """
+    products = {
+        row['id']: row
+        for row in Product.objects.filter(pk__in={item['product'] for item in items}).values(*PRODUCT_COLUMNS)
+    }
+    lines, errors, total = [], [], Decimal('0.00')
+    for item in items:
+        product = products.get(item['product'])
+        if product is None:
+            errors.append(f"Product {item['product']} does not exist.")
+            continue
+        if not product['in_stock']:
+            errors.append(f"{product['name']} is out of stock.")
+            continue
+        # An early, advisory check; inventory.reserve() makes the binding one
+        if product['stock_quantity'] is not None and product['stock_quantity'] < item['quantity']:
+            errors.append(f"Only {product['stock_quantity']} of {product['name']} left.")
+            continue
+        price = unit_price(product['price'], product['discount'])
+        total += price * item['quantity']
+        lines.append({
+            'product': product['id'],
+            'name': product['name'],
+            'quantity': item['quantity'],
+            'price': str(price),
+        })
+    return lines, total, errors
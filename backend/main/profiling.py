@@ -0,0 +1,227 @@
+"""
+On-demand request profiling for staff.
+
+A staff user issues a signed token from the admin's Request profiles page and
+sends it with any request as an ``X-Profile`` header or a ``profile`` query
+parameter. ProfilingMiddleware then runs that request under a profiler,
+pyinstrument's sampling profiler when it is installed and cProfile otherwise,
+and saves the result under PROFILE_DIR as a pstats ``.prof`` file with a JSON
+summary of the request and its top functions next to it. Only the newest
+PROFILE_MAX_FILES profiles are kept. PROFILE_DIR is not served: profiles are
+downloaded through the staff-only admin page, and the saved path leaves out
+the token.
+
+Requests without a token pay for one header lookup. Tokens expire after
+PROFILE_TOKEN_MAX_AGE seconds and stop working when their user loses staff
+status. Turn the whole thing off with PROFILING=false.
+"""
+import cProfile
+import json
+import logging
+import pstats
+import re
+import secrets
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+    from pyinstrument.renderers import PstatsRenderer
+except ImportError:
+    SamplingProfiler = None
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_PROFILE'
+PARAMETER = 'profile'
+SALT = 'main.profiling'
+TOP_FUNCTIONS = 15
+PROFILE_ID = re.compile(r'^\d{8}-\d{12}-[0-9a-f]{8}$')
+
+
+def issue_token(user):
+    return signing.dumps({'user': user.pk}, salt=SALT, compress=True)
+
+
+def token_user(token):
+    """The username of the active staff user ``token`` was issued to, or None"""
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return get_user_model().objects.filter(
+        pk=payload.get('user'), is_staff=True, is_active=True
+    ).values_list('username', flat=True).first()
+
+
+def directory():
+    return Path(settings.PROFILE_DIR)
+
+
+def profile_path(profile_id, suffix='.prof'):
+    """The file of a profile; ValueError for anything that isn't a profile id"""
+    if not PROFILE_ID.match(profile_id):
+        raise ValueError(f"Not a profile id: {profile_id!r}")
+    return directory() / f'{profile_id}{suffix}'
+
+
+class Recorder:
+    """One profiled request: start(), stop(), then save() the result"""
+
+    def __init__(self):
+        self.sampling = SamplingProfiler is not None and settings.PROFILER != 'cprofile'
+        self.profiler = SamplingProfiler() if self.sampling else cProfile.Profile()
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.sampling:
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.sampling:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+
+    def save(self, request, response, username):
+        now = timezone.now()
+        profile_id = f'{now:%Y%m%d-%H%M%S%f}-{secrets.token_hex(4)}'
+        path = profile_path(profile_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self.sampling:
+            path.write_bytes(PstatsRenderer().render(self.profiler.last_session))
+        else:
+            self.profiler.dump_stats(path)
+        summary = {
+            'id': profile_id,
+            'created_at': now.isoformat(),
+            'method': request.method,
+            'path': _path_without_token(request),
+            'status': response.status_code,
+            'user': username,
+            'profiler': 'pyinstrument' if self.sampling else 'cProfile',
+            'duration_ms': round(self.duration * 1000, 2),
+            'top': top_functions(path),
+        }
+        profile_path(profile_id, '.json').write_text(json.dumps(summary))
+        rotate()
+        return profile_id
+
+
+def _path_without_token(request):
+    query = request.GET.copy()
+    query.pop(PARAMETER, None)
+    return f"{request.path}?{query.urlencode()}" if query else request.path
+
+
+def top_functions(path, limit=TOP_FUNCTIONS):
+    """The functions of a .prof file with the most time of their own"""
+    stats = pstats.Stats(str(path))
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            'function': pstats.func_std_string(function),
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        }
+        for function, (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def rotate():
+    """Delete all but the newest PROFILE_MAX_FILES profiles"""
+    # Profile ids start with their creation time, so names sort oldest first
+    profiles = sorted(directory().glob('*.prof'))
+    for path in profiles[:max(len(profiles) - settings.PROFILE_MAX_FILES, 0)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.json').unlink(missing_ok=True)
+
+
+def recent_profiles():
+    """Summaries of the stored profiles, newest first"""
+    summaries = []
+    for path in sorted(directory().glob('*.json'), reverse=True):
+        try:
+            summaries.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # Rotated away or half written by a concurrent request
+            continue
+    return summaries
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _token(request):
+        return request.META.get(HEADER) or request.GET.get(PARAMETER)
+
+    def _recorder(self, request):
+        token = self._token(request)
+        if not token:
+            return None, None
+        username = token_user(token)
+        if username is None:
+            logger.warning("Ignored an invalid or expired profiling token for %s", request.path)
+            return None, None
+        return Recorder(), username
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder, username = self._recorder(request)
+        if recorder is None:
+            return self.get_response(request)
+        try:
+            recorder.start()
+        except ValueError:
+            # Another profiler is already running in this thread
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            recorder.stop()
+        return self.finish(request, response, recorder, username)
+
+    async def __acall__(self, request):
+        if not self._token(request):
+            return await self.get_response(request)
+        recorder, username = await sync_to_async(self._recorder)(request)
+        if recorder is None:
+            return await self.get_response(request)
+        # cProfile sees every task on the event loop's thread while this request runs
+        try:
+            recorder.start()
+        except ValueError:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            recorder.stop()
+        return self.finish(request, response, recorder, username)
+
+    def finish(self, request, response, recorder, username):
+        try:
+            response['X-Profile-Id'] = recorder.save(request, response, username)
+        except OSError:
+            logger.exception("Couldn't save the profile of %s", request.path)
+        return response
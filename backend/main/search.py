@@ -0,0 +1,113 @@
+"""
+Full-text product search.
+
+PostgreSQL keeps a weighted tsvector in main_product.search_vector behind a GIN
+index; SQLite keeps an FTS5 shadow table, main_product_fts, keyed by product id.
+Both are created by migration 0010, maintained from model signals and queried
+with prefix matching on every term. Other databases fall back to icontains
+lookups.
+"""
+import re
+
+from django.db import connection
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERMS = 10
+FTS_TABLE = 'main_product_fts'
+
+POSTGRES_VECTOR = """
+    setweight(to_tsvector('english', p.name), 'A') ||
+    setweight(to_tsvector('english', c.name), 'B') ||
+    setweight(to_tsvector('english', coalesce(p.size, '') || ' ' || coalesce(p.flavour, '')), 'B') ||
+    setweight(to_tsvector('english', p.description), 'C')
+"""
+
+
+def search_terms(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def search_product_ids(query, limit):
+    """Return up to ``limit`` product ids matching every term, best match first"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'postgresql':
+        sql = """
+            SELECT id FROM main_product, to_tsquery('english', %s) query
+            WHERE search_vector @@ query
+            ORDER BY ts_rank_cd(search_vector, query) DESC, id
+            LIMIT %s
+        """
+        params = [' & '.join(f'{term}:*' for term in terms), limit]
+    elif connection.vendor == 'sqlite':
+        # Column weights: name, description, category, size, flavour
+        sql = f"""
+            SELECT rowid FROM {FTS_TABLE}
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY bm25({FTS_TABLE}, 10.0, 1.0, 5.0, 2.0, 2.0), rowid
+            LIMIT %s
+        """
+        params = [' '.join(f'"{term}"*' for term in terms), limit]
+    else:
+        return _fallback_search(terms, limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_search(terms, limit):
+    from django.db.models import Q
+    from .models import Product
+
+    queryset = Product.objects.all()
+    for term in terms:
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+        )
+    return list(queryset.values_list('id', flat=True)[:limit])
+
+
+def index_products(product_ids, using=None):
+    if product_ids:
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        _reindex(f'p.id IN ({placeholders})', list(product_ids), using)
+
+
+def index_category(category_id, using=None):
+    _reindex('p.category_id = %s', [category_id], using)
+
+
+def rebuild_index(using=None):
+    _reindex('1 = 1', [], using)
+
+
+def remove_products(product_ids, using=None):
+    using = using or connection
+    if product_ids and using.vendor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with using.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(product_ids))
+
+
+def _reindex(where, params, using):
+    using = using or connection
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(f"""
+                UPDATE main_product p SET search_vector = {POSTGRES_VECTOR}
+                FROM main_category c
+                WHERE c.id = p.category_id AND {where}
+            """, params)
+        elif using.vendor == 'sqlite':
+            cursor.execute(f"""
+                DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM main_product p WHERE {where})
+            """, params)
+            cursor.execute(f"""
+                INSERT INTO {FTS_TABLE} (rowid, name, description, category, size, flavour)
+                SELECT p.id, p.name, p.description, c.name, coalesce(p.size, ''), coalesce(p.flavour, '')
+                FROM main_product p JOIN main_category c ON c.id = p.category_id
+                WHERE {where}
+            """, params)
@@ -0,0 +1,146 @@
+"""
+Reproducible fake catalogs and orders for development and the benchmark suite.
+
+seed() writes categories, products, images and orders generated by Faker and
+a random.Random from one seed, so the same arguments give the same rows on
+every machine. Rows go in with bulk_create, batch_size at a time, which skips
+model signals: image variants are queued with each batch, and the search
+index, facet cells and catalog cache are rebuilt at the end, as after a
+catalog import.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from . import derivatives, facets, search
+from .cache import invalidate_catalog
+from .catalog_io import batches
+from .models import Category, Order, OrderItem, Product, ProductImage
+from .orders import order_item_rows
+from .pricing import unit_price
+
+SIZES = ['S', 'M', 'L', 'XL', None]
+FLAVOURS = ['Mint', 'Lemon', 'Cherry', 'Vanilla', None]
+STATUSES = ['pending', 'confirmed', 'shipped', 'delivered', 'cancelled']
+# Orders are spread over this many days before now
+ORDER_HISTORY_DAYS = 365
+
+
+def clear():
+    """Delete every order and the whole catalog"""
+    with transaction.atomic():
+        Order.objects.all().delete()
+        Category.objects.all().delete()
+    facets.rebuild()
+    search.rebuild_index()
+    invalidate_catalog()
+
+
+def _categories(fake, count):
+    # Faker words repeat, so the index keeps the names distinct
+    return Category.objects.bulk_create([Category(name=f'{fake.word().title()} {i}') for i in range(count)])
+
+
+def _products(fake, rng, categories, count):
+    for i in range(count):
+        stock_quantity = rng.choice([None, None, None, 0, rng.randint(1, 500)])
+        yield Product(
+            name=fake.catch_phrase()[:100],
+            description=fake.paragraph(nb_sentences=6),
+            price=Decimal(rng.randint(100, 99999)) / 100,
+            category=categories[i % len(categories)],
+            in_stock=rng.random() > 0.1 if stock_quantity is None else stock_quantity > 0,
+            stock_quantity=stock_quantity,
+            featured=rng.random() < 0.05,
+            discount=rng.choice([0.82, 0.9, 1.0]),
+            size=rng.choice(SIZES),
+            flavour=rng.choice(FLAVOURS),
+        )
+
+
+def _images(fake, products, per_product):
+    return [
+        ProductImage(
+            product=product,
+            image=f'/media/products/{product.pk}-{order}.jpg',
+            alt_text=fake.sentence(nb_words=4)[:200],
+            is_primary=order == 0,
+            order=order,
+        )
+        for product in products
+        for order in range(per_product)
+    ]
+
+
+def _orders(fake, rng, products, count, now):
+    for _ in range(count):
+        lines = []
+        for product in rng.sample(products, min(rng.randint(1, 5), len(products))):
+            lines.append({
+                'product': product.pk,
+                'name': product.name,
+                'quantity': rng.randint(1, 3),
+                'price': str(unit_price(product.price, product.discount)),
+            })
+        order = Order(
+            customer_name=fake.name()[:100],
+            customer_email=fake.email(),
+            # customer_phone is a 32-bit integer column
+            customer_phone=rng.randint(1000000000, 2147483647),
+            customer_address=fake.address(),
+            total_amount=sum(Decimal(line['price']) * line['quantity'] for line in lines),
+            order_items=lines,
+            status=rng.choice(STATUSES),
+        )
+        # Assigned after bulk_create, which stamps auto_now_add fields itself
+        order.seeded_at = now - timedelta(seconds=rng.randint(0, ORDER_HISTORY_DAYS * 24 * 3600))
+        yield order
+
+
+def seed(categories, products, images_per_product=2, orders=0, seed=0, batch_size=1000, progress=None):
+    """
+    Add ``categories`` categories, ``products`` products with
+    ``images_per_product`` images each and ``orders`` orders; returns the
+    created products. ``progress`` is called with (label, rows written so far).
+    """
+    fake = Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+
+    category_objs = _categories(fake, max(categories, 1))
+    created = []
+    for batch in batches(_products(fake, rng, category_objs, products), batch_size):
+        with transaction.atomic():
+            Product.objects.bulk_create(batch)
+            derivatives.queue(ProductImage.objects.bulk_create(_images(fake, batch, images_per_product)))
+        created.extend(batch)
+        if progress:
+            progress('products', len(created))
+
+    # Orders reference products that can be bought
+    buyable = [product for product in created if product.in_stock] or created
+    product_ids = {product.pk for product in buyable}
+    written = 0
+    now = timezone.now()
+    if buyable:
+        for batch in batches(_orders(fake, rng, buyable, orders, now), batch_size):
+            with transaction.atomic():
+                Order.objects.bulk_create(batch)
+                for order in batch:
+                    order.created_at = order.seeded_at
+                Order.objects.bulk_update(batch, ['created_at'])
+                OrderItem.objects.bulk_create([
+                    item for order in batch for item in order_item_rows(order, order.order_items, product_ids)
+                ])
+            written += len(batch)
+            if progress:
+                progress('orders', written)
+
+    search.rebuild_index()
+    facets.rebuild()
+    invalidate_catalog()
+    return created
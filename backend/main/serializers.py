@@ -1,4 +1,10 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
+from . import derivatives, orders, outbox, pricing
 from .models import Category, Product, Order, ProductImage
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -14,36 +20,125 @@ class ProductImageSerializer(serializers.ModelSerializer):
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
+        request = self.context.get('request')
         # Ensure the image URL is absolute
         if 'http' not in (representation['image'] or ''):
-            request = self.context.get('request')
             if request and representation['image']:
                 representation['image'] = request.build_absolute_uri(representation['image'])
+        # Resized variants, once rendered, and the srcset per media type built from them
+        representation['variants'], representation['srcset'] = derivatives.variants(
+            instance, request.build_absolute_uri if request else None
+        )
         return representation
 
+class ProductImageAttachSerializer(serializers.Serializer):
+    class ImageSerializer(serializers.ModelSerializer):
+        class Meta:
+            model = ProductImage
+            fields = ['image', 'alt_text', 'is_primary']
+
+    images = ImageSerializer(many=True, allow_empty=False, max_length=settings.PRODUCT_IMAGES_MAX_BATCH)
+
+
+class ProductImageOrderSerializer(serializers.Serializer):
+    """Every image id of the product in display order; ``primary`` optionally picks the primary image"""
+    order = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    primary = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        image_ids = set(self.context['image_ids'])
+        if len(data['order']) != len(set(data['order'])) or set(data['order']) != image_ids:
+            raise serializers.ValidationError({'order': "List every image of the product exactly once."})
+        if data.get('primary') is not None and data['primary'] not in image_ids:
+            raise serializers.ValidationError({'primary': "Not an image of this product."})
+        return data
+
+
 class ProductSerializer(serializers.ModelSerializer):
+    """
+    Product representation with sparse fieldsets for GET requests.
+
+    ?fields=id,name picks the fields to return, ?expand=primary_image adds fields
+    that are left out by default and ?view=compact returns the storefront grid
+    representation with only the primary image.
+    """
     category_name = serializers.CharField(source='category.name', read_only=True)
     images = serializers.SerializerMethodField()
-    
+    primary_image = serializers.SerializerMethodField()
+
+    # Only returned when asked for through ?fields= or ?expand=
+    expandable_fields = ['primary_image']
+    compact_fields = ['id', 'name', 'price', 'discount', 'category', 'category_name', 'primary_image']
+    # Model columns each field reads, when not just the field name
+    field_columns = {
+        'category': ['category'],
+        'category_name': ['category', 'category__name'],
+        'images': ['image'],
+        'primary_image': ['image'],
+    }
+
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'category', 'category_name', 
-            'in_stock', 'featured', 'discount', 'images', 'size', 'flavour'
+            'in_stock', 'featured', 'discount', 'images', 'size', 'flavour', 'primary_image'
         ]
-    
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = set(self.requested_fields(self.context.get('request')))
+        for name in list(self.fields):
+            if name not in requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        """The fields to serialize for this request, in declaration order"""
+        params = {}
+        if request is not None and request.method == 'GET':
+            # DRF requests expose query_params; the async views pass a plain HttpRequest
+            params = getattr(request, 'query_params', request.GET)
+        if params.get('view') == 'compact':
+            selected = set(cls.compact_fields)
+        else:
+            selected = set(cls.Meta.fields) - set(cls.expandable_fields)
+        only = {name for name in params.get('fields', '').split(',') if name in cls.Meta.fields}
+        if only:
+            selected = only
+        selected |= {name for name in params.get('expand', '').split(',') if name in cls.Meta.fields}
+        return [name for name in cls.Meta.fields if name in selected]
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields):
+        """Load only the columns and relations the given fields read"""
+        columns = {'id', 'name', 'created_at'}
+        for name in fields:
+            columns.update(cls.field_columns.get(name, [name]))
+        queryset = queryset.only(*columns)
+        if 'category_name' in fields:
+            queryset = queryset.select_related('category')
+        if 'images' in fields or 'primary_image' in fields:
+            # All of them: primary_image falls back to the first image of a product without a primary
+            queryset = queryset.prefetch_related(
+                Prefetch('productimage_set', queryset=ProductImage.objects.order_by('order', 'created_at'))
+            )
+        return queryset
+
     def get_images(self, obj):
-        # Get all images for the product, ordered by 'order' and 'created_at'
-        images = obj.images.all()
+        # Get all images for the product, ordered by 'order' and 'created_at'.
+        # Evaluating the (usually prefetched) queryset once avoids an extra exists() query.
+        images = list(obj.images)
         # If no images exist but there's a legacy image, include it
-        if not images.exists() and obj.image:
+        if not images and obj.image:
             return [
                 {
                     'id': 0,
                     'image': self._get_absolute_url(obj.image),
                     'is_primary': True,
                     'alt_text': obj.name,
-                    'order': 0
+                    'order': 0,
+                    'variants': {},
+                    'srcset': {},
                 }
             ]
         # Serialize the images
@@ -53,6 +148,23 @@ class ProductSerializer(serializers.ModelSerializer):
             context=self.context
         ).data
     
+    def get_primary_image(self, obj):
+        images = list(obj.images)
+        primary = next((image for image in images if image.is_primary), images[0] if images else None)
+        if primary is not None:
+            return ProductImageSerializer(primary, context=self.context).data
+        if obj.image:
+            return {
+                'id': 0,
+                'image': self._get_absolute_url(obj.image),
+                'is_primary': True,
+                'alt_text': obj.name,
+                'order': 0,
+                'variants': {},
+                'srcset': {},
+            }
+        return None
+
     def _get_absolute_url(self, url):
         """Helper method to convert relative URLs to absolute"""
         if not url or url.startswith(('http://', 'https://')):
@@ -66,22 +178,59 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['customer_name', 'customer_email', 'customer_phone', 'customer_address', 'total_amount', 'order_items']
-        read_only_fields = ['status']
+        read_only_fields = ['status', 'total_amount']
 
     def validate_order_items(self, value):
         if not value or not isinstance(value, list):
             raise serializers.ValidationError("Order must contain at least one item.")
+        if len(value) > settings.ORDER_MAX_ITEMS:
+            raise serializers.ValidationError(f"An order can have at most {settings.ORDER_MAX_ITEMS} items.")
         for item in value:
-            if not all(key in item for key in ['name', 'quantity', 'price']):
-                raise serializers.ValidationError("Each item must have 'name', 'quantity', and 'price'.")
+            if not isinstance(item, dict) or not all(key in item for key in ['product', 'quantity']):
+                raise serializers.ValidationError("Each item must have 'product' and 'quantity'.")
+            for key in ['product', 'quantity']:
+                if type(item[key]) is not int or item[key] < 1:
+                    raise serializers.ValidationError(f"'{key}' must be a positive integer.")
+            if item['quantity'] > settings.ORDER_MAX_QUANTITY:
+                raise serializers.ValidationError(f"'quantity' can be at most {settings.ORDER_MAX_QUANTITY}.")
         return value
 
-    def validate_total_amount(self, value):
-        if value <= 0:
-            raise serializers.ValidationError("Total amount must be greater than zero.")
-        return value
+    def validate(self, attrs):
+        # Prices and the total are always computed from the catalog
+        lines, total, errors = pricing.price_items(attrs['order_items'])
+        if errors:
+            raise serializers.ValidationError({'order_items': errors})
+        # The total must fit total_amount's max_digits
+        field = Order._meta.get_field('total_amount')
+        if total >= Decimal(10) ** (field.max_digits - field.decimal_places):
+            raise serializers.ValidationError({'order_items': ["The order total is too large."]})
+        attrs['order_items'] = lines
+        attrs['total_amount'] = total
+        return attrs
+
+    def create(self, validated_data):
+        # The stock is reserved by orders.save_order(), last in its transaction
+        with transaction.atomic():
+            order = super().create(validated_data)
+            orders.create_items(order)
+            outbox.enqueue('order.created', {'order_id': order.id})
+        return order
 
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class CartItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=settings.CART_MAX_QUANTITY, default=1)
+
+    def validate_product(self, value):
+        if not Product.objects.filter(pk=value).exists():
+            raise serializers.ValidationError(f"Product {value} does not exist.")
+        return value
+
+
+class CartQuantitySerializer(serializers.Serializer):
+    # 0 removes the item
+    quantity = serializers.IntegerField(min_value=0, max_value=settings.CART_MAX_QUANTITY)
@@ -0,0 +1,80 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import derivatives, facets, instrumentation, inventory, outbox, search
+from .cache import invalidate_catalog
+from .models import Category, Order, Product, ProductImage
+
+
+def catalog_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Product, dispatch_uid='index_product')
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='unindex_product')
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(pre_save, sender=Product, dispatch_uid='remember_facet_cell')
+def remember_facet_cell(sender, instance, **kwargs):
+    previous = None
+    if instance.pk is not None:
+        previous = Product.objects.filter(pk=instance.pk).values(
+            'category_id', 'featured', 'in_stock', 'size', 'flavour', 'price'
+        ).first()
+    instance._facet_cell = facets.cell_key(previous) if previous else None
+
+
+@receiver(post_save, sender=Product, dispatch_uid='update_facet_cell')
+def update_facet_cell(sender, instance, **kwargs):
+    facets.move_product(getattr(instance, '_facet_cell', None), facets.cell_key(instance))
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='remove_facet_cell')
+def remove_facet_cell(sender, instance, **kwargs):
+    facets.move_product(facets.cell_key(instance), None)
+
+
+@receiver(post_save, sender=Category, dispatch_uid='index_category')
+def index_category(sender, instance, created=False, raw=False, **kwargs):
+    # A new category has no products to reindex yet
+    if not created and not raw:
+        search.index_category(instance.pk)
+
+
+@receiver(post_save, sender=ProductImage, dispatch_uid='queue_image_derivatives')
+def queue_image_derivatives(sender, instance, raw=False, **kwargs):
+    # New images and changed URLs get their resized variants rendered by the outbox worker
+    if not raw and derivatives.needs_render(instance):
+        outbox.enqueue(derivatives.TOPIC, {'image_id': instance.pk})
+
+
+@receiver(pre_save, sender=Order, dispatch_uid='remember_order_status')
+def remember_order_status(sender, instance, **kwargs):
+    instance._previous_status = None
+    if instance.pk is not None:
+        instance._previous_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order, dispatch_uid='release_cancelled_stock')
+def release_cancelled_stock(sender, instance, raw=False, **kwargs):
+    # Confirmed orders keep their stock until they are cancelled
+    if not raw and instance.status == 'cancelled' and getattr(instance, '_previous_status', None) != 'cancelled':
+        inventory.release_order(instance.pk)
+
+
+@receiver(connection_created, dispatch_uid='time_sql')
+def time_sql(sender, connection, **kwargs):
+    instrumentation.install(connection)
+
+
+for model in (Category, Product, ProductImage):
+    post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_save_{model.__name__}')
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_delete_{model.__name__}')
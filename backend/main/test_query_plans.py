@@ -0,0 +1,160 @@
+"""
+EXPLAIN-based regression tests for the hot catalog and order query shapes.
+
+Each shape lists the indexes the planner may pick. A test fails when the plan
+falls back to a sequential scan of the table or stops using one of those indexes.
+"""
+import re
+from unittest import skipUnless
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.test import RequestFactory, TestCase
+from rest_framework.request import Request
+
+from .admin import OrderAdmin
+from .models import Category, Order, Product, ProductImage
+from .views import ProductViewSet
+
+SEQUENTIAL_SCAN = {
+    # "SCAN table" without "USING [COVERING] INDEX" walks the whole table
+    'sqlite': r'\bSCAN {table}\b(?! USING)',
+    'postgresql': r'Seq Scan on {table}\b',
+}
+
+
+def product_list(**params):
+    """The queryset ProductViewSet lists for GET /api/products/ with these query parameters"""
+    request = Request(RequestFactory().get('/api/products/', params))
+    view = ProductViewSet(request=request, action='list', format_kwarg=None, kwargs={})
+    return view.get_queryset()[:10]
+
+
+def product_keyset_seek():
+    return Product.objects.filter(
+        Q(name__gte='Product 50') & (Q(name__gt='Product 50') | Q(id__gt=50))
+    ).order_by('name', 'id')[:11]
+
+
+def product_newest():
+    return Product.objects.order_by('-created_at', '-id')[:11]
+
+
+def product_images(product_ids):
+    return ProductImage.objects.filter(product_id__in=product_ids).order_by('order', 'created_at')
+
+
+def order_changelist(**params):
+    """The queryset the Order changelist pages through for these query parameters"""
+    request = RequestFactory().get('/admin/main/order/', params)
+    request.user = User(is_active=True, is_staff=True, is_superuser=True)
+    changelist = OrderAdmin(Order, admin.site).get_changelist_instance(request)
+    return changelist.get_queryset(request)[:changelist.list_per_page]
+
+
+class QueryPlanTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=f"Category {i}") for i in range(20)])
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i:04d}",
+                description="Description",
+                price=10,
+                category=categories[i % 20],
+                featured=i % 20 == 0,
+                in_stock=i % 7 != 0
+            )
+            for i in range(2000)
+        ])
+        cls.product_ids = list(Product.objects.values_list('id', flat=True)[:10])
+        cls.category_id = categories[0].id
+        ProductImage.objects.bulk_create([
+            ProductImage(product_id=product_id, image=f"https://example.com/{product_id}.jpg")
+            for product_id in Product.objects.values_list('id', flat=True)
+        ])
+        Order.objects.bulk_create([
+            Order(
+                customer_name="John Doe",
+                customer_email="john@example.com",
+                customer_phone=1234567890,
+                customer_address="123 Main St",
+                total_amount=10,
+                order_items=[],
+                status=['pending', 'confirmed', 'shipped', 'cancelled'][i % 4]
+            )
+            for i in range(2000)
+        ])
+
+    def assertUsesIndex(self, queryset, table, indexes):
+        plan = queryset.explain()
+        pattern = SEQUENTIAL_SCAN[connection.vendor].format(table=table)
+        self.assertIsNone(re.search(pattern, plan), f"Sequential scan on {table}:\n{plan}")
+        self.assertTrue(any(index in plan for index in indexes), f"None of {indexes} used:\n{plan}")
+
+    def test_product_list(self):
+        self.assertUsesIndex(product_list(), 'main_product', ['product_name_id_idx'])
+
+    def test_product_list_by_category(self):
+        self.assertUsesIndex(
+            product_list(category=self.category_id), 'main_product', ['product_category_name_idx']
+        )
+
+    def test_product_list_by_category_featured(self):
+        self.assertUsesIndex(
+            product_list(category=self.category_id, featured='true', in_stock='true'),
+            'main_product',
+            ['product_cat_feat_stock_idx', 'product_category_name_idx']
+        )
+
+    def test_product_list_featured(self):
+        self.assertUsesIndex(
+            product_list(featured='true'), 'main_product', ['product_feat_stock_name_idx', 'product_name_id_idx']
+        )
+
+    def test_product_keyset_seek(self):
+        self.assertUsesIndex(product_keyset_seek(), 'main_product', ['product_name_id_idx'])
+
+    def test_product_newest(self):
+        self.assertUsesIndex(product_newest(), 'main_product', ['product_created_id_idx'])
+
+    def test_product_images(self):
+        self.assertUsesIndex(
+            product_images(self.product_ids),
+            'main_productimage',
+            ['productimage_product_order_idx', 'main_productimage_product_id']
+        )
+
+    def test_orders_by_status(self):
+        self.assertUsesIndex(order_changelist(status__exact='pending'), 'main_order', ['order_status_created_idx'])
+
+    def test_orders_search(self):
+        plan = order_changelist(q='john').explain()
+        self.assertIsNone(re.search(SEQUENTIAL_SCAN[connection.vendor].format(table='main_order'), plan), plan)
+        self.assertIn('order_name_prefix_idx', plan)
+        self.assertIn('order_email_prefix_idx', plan)
+
+    def test_orders_since(self):
+        self.assertUsesIndex(
+            order_changelist(created_at__gte='2024-01-01 00:00:00+00:00'), 'main_order',
+            ['order_created_idx', 'order_status_created_idx']
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite query plans')
+class SQLiteQueryPlanTest(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL query plans')
+class PostgreSQLQueryPlanTest(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            # The test tables are small enough that a sequential scan is always
+            # cheapest; disabling it shows whether an index path exists at all.
+            cursor.execute('SET LOCAL enable_seqscan = off')
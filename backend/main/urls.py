@@ -11,6 +11,11 @@ router.register(r'categories', views.CategoryViewSet, basename='category')
 urlpatterns = [
     path('', include(router.urls)),
     path('orders/', OrderListView.as_view(), name='order-list'),
+    path('orders/export/', views.OrderExportView.as_view(), name='order-export'),
     path('orders/create/', views.create_order, name='create-order'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
     path('whatsapp/', views.get_whatsapp_number, name='whatsapp-number'),
+    path('cart/', views.get_cart, name='cart'),
+    path('cart/items/', views.add_to_cart, name='cart-add'),
+    path('cart/items/<int:product_id>/', views.update_cart_item, name='cart-item'),
 ]
\ No newline at end of file
@@ -2,48 +2,157 @@ from django.core.serializers import serialize
 from pyexpat import features
 
 from rest_framework import generics, status, viewsets
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view
+from rest_framework.permissions import IsAdminUser
 from django.conf import settings
 from urllib.parse import quote
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from unicodedata import category
+from functools import partial
 
-from .models import Category, Product, Order
-from .serializers import CategorySerializer, ProductSerializer, OrderCreateSerializer, OrderSerializer
+from . import cart, exports, facets, fastpath, instrumentation, inventory, notifications, orders, search
+from .cache import cached_response
+from .models import Category, IdempotencyKey, Product, ProductImage, Order
+from .pagination import KeysetPagination
+from .serializers import (
+    CartItemSerializer, CartQuantitySerializer, CategorySerializer, ProductImageAttachSerializer,
+    ProductImageOrderSerializer, ProductImageSerializer, ProductSerializer, OrderCreateSerializer, OrderSerializer
+)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CatalogCacheMixin:
+    """Serve list and retrieve responses through the versioned catalog cache"""
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, partial(super().retrieve, request, *args, **kwargs))
+
+
+class FastListMixin:
+    """
+    Build list responses from values() rows through main.fastpath instead of
+    the serializer. Views provide get_fast_queryset() and build_fast_data(rows).
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.CATALOG_FAST_PATH:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_fast_queryset())
+        rows = self.paginate_queryset(queryset)
+        if rows is None:
+            return Response(self.build_fast_data(list(queryset)))
+        return self.get_paginated_response(self.build_fast_data(rows))
+
+
+class CategoryViewSet(CatalogCacheMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     http_method_names = ['get']  # Only allow GET requests
 
-class ProductViewSet(viewsets.ModelViewSet):
+    def get_fast_queryset(self):
+        return self.get_queryset().values(*fastpath.CATEGORY_COLUMNS)
+
+    def build_fast_data(self, rows):
+        return fastpath.build_categories(rows)
+
+class ProductViewSet(CatalogCacheMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # ?pagination=cursor opts into keyset pagination; page numbers stay the default
+        if self.action == 'list' and request.query_params.get('pagination') == 'cursor':
+            self.pagination_class = KeysetPagination
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
     def get_queryset(self):
-        queryset = Product.objects.all()
-        category = self.request.query_params.get('category', None)
-        featured = self.request.query_params.get('featured', None)
+        # category, size, flavour and price accept several comma separated values;
+        # featured and in_stock take true/false
+        filters = facets.parse_filters(self.request.query_params)
+        return facets.filter_products(self.get_product_queryset(), filters)
+
+    def get_product_queryset(self):
+        fields = ProductSerializer.requested_fields(self.request)
+        return ProductSerializer.setup_queryset(Product.objects.all(), fields)
+
+    def get_fast_queryset(self):
+        filters = facets.parse_filters(self.request.query_params)
+        fields = ProductSerializer.requested_fields(self.request)
+        return fastpath.product_values(facets.filter_products(Product.objects.all(), filters), fields)
+
+    def build_fast_data(self, rows):
+        return fastpath.build_products(rows, ProductSerializer.requested_fields(self.request), self.request)
 
-        if category is not None:
-            queryset = queryset.filter(category_id=category)
+    @action(detail=False, url_path='facets')
+    def faceted(self, request):
+        """Filtered product page plus per-facet counts under the same filters"""
+        return cached_response(request, self._faceted)
 
-        if featured is not None:
-            queryset = queryset.filter(featured=True)
+    def _faceted(self):
+        response = FastListMixin.list(self, self.request)
+        response.data['facets'] = facets.facet_counts(facets.parse_filters(self.request.query_params))
+        return response
 
-        return queryset
+    @action(detail=False)
+    def search(self, request):
+        """Ranked full-text search over name, description, category, size and flavour"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'q': ['This query parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        return cached_response(request, partial(self._search, query))
 
-class ProductDetailView(generics.RetrieveAPIView):
+    @action(detail=True, methods=['post', 'patch'], permission_classes=[IsAdminUser])
+    def images(self, request, pk=None):
+        """
+        POST appends a batch of images, PATCH reorders them and can move the
+        primary flag. Both answer with the product's images in display order.
+        """
+        product = generics.get_object_or_404(Product.objects.only('pk'), pk=pk)
+        images = ProductImage.objects.filter(product=product).order_by('order', 'created_at')
+        if request.method == 'POST':
+            serializer = ProductImageAttachSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            ProductImage.objects.attach(product, serializer.validated_data['images'])
+            response_status = status.HTTP_201_CREATED
+        else:
+            serializer = ProductImageOrderSerializer(
+                data=request.data, context={'image_ids': images.values_list('pk', flat=True)}
+            )
+            serializer.is_valid(raise_exception=True)
+            ProductImage.objects.reorder(product, serializer.validated_data['order'],
+                                         primary=serializer.validated_data.get('primary'))
+            response_status = status.HTTP_200_OK
+        return Response(
+            ProductImageSerializer(images, many=True, context={'request': request}).data, status=response_status
+        )
+
+    def _search(self, query):
+        product_ids = search.search_product_ids(query, settings.SEARCH_MAX_RESULTS)
+        page = self.paginate_queryset(product_ids)
+        products = self.get_product_queryset().in_bulk(page)
+        serializer = self.get_serializer([products[pk] for pk in page if pk in products], many=True)
+        return self.get_paginated_response(serializer.data)
+
+class ProductDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    def get_queryset(self):
+        fields = ProductSerializer.requested_fields(self.request)
+        return ProductSerializer.setup_queryset(super().get_queryset(), fields)
+
 from rest_framework.permissions import IsAuthenticated
 
 class OrderListView(generics.ListAPIView):
@@ -51,21 +160,98 @@ class OrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
+class FirstRendererNegotiation(BaseContentNegotiation):
+    """Answer errors with the first renderer whatever the client accepts; the export streams its own format"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+class OrderExportView(APIView):
+    """
+    Every order matching ?created_after=, ?created_before= (dates or ISO date
+    times) and ?status= (comma separated), streamed as ?format=csv (default)
+    or ?format=ndjson.
+    """
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = FirstRendererNegotiation
+
+    def get(self, request):
+        fmt = request.query_params.get('format', 'csv')
+        if fmt not in exports.FORMATS:
+            return Response({'format': [f"Choose one of {', '.join(exports.FORMATS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        filters, errors = exports.parse_filters(request.query_params)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        export = exports.aexport_orders if isinstance(request._request, ASGIRequest) else exports.export_orders
+        response = StreamingHttpResponse(export(filters, fmt), content_type=exports.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+        # Ask proxies not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class MetricsView(APIView):
+    """Per-endpoint request histograms of this worker in the Prometheus text format"""
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = FirstRendererNegotiation
+
+    def get(self, request):
+        return HttpResponse(
+            instrumentation.histograms.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+def order_response(order):
+    #Whatsapp: the order and its total; the full text is rendered by the outbox worker
+    message = notifications.render_order_link_text(order)
+    whatsapp_url = f"https://wa.me/{settings.WHATSAPP_NUMBER.replace('+','')}?text={quote(message)}"
+
+    return {
+        'success': True,
+        'order_id': order.id,
+        'total_amount': str(order.total_amount),
+        'whatsapp_url': whatsapp_url,
+        'message': 'Order created successfully'
+    }
+
+def idempotency_error(message, status_code):
+    return Response({'success': False, 'errors': {'Idempotency-Key': [message]}}, status=status_code)
+
 @api_view(['POST'])
 def create_order(request):
+    # A retry sent with the same Idempotency-Key gets the first response back
+    key = request.headers.get('Idempotency-Key')
+    fingerprint = ''
+    if key is not None:
+        if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return idempotency_error('Must be between 1 and 255 characters.', status.HTTP_400_BAD_REQUEST)
+        fingerprint = orders.request_fingerprint(request.data)
+        try:
+            replay = orders.replayed_response(key, fingerprint)
+        except orders.IdempotencyConflict:
+            return idempotency_error(
+                'This key was already used with a different request.', status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if replay is not None:
+            return Response(replay, status=status.HTTP_201_CREATED, headers={'Idempotent-Replayed': 'true'})
+
     serializer = OrderCreateSerializer(data=request.data)
     if serializer.is_valid():
-        order = serializer.save()
-        #Whatsapp
-        message = order.get_order_text()
-        whatsapp_url = f"https://wa.me/{settings.WHATSAPP_NUMBER.replace('+','')}?text={quote(message)}"
-
-        return Response({
-            'success': True,
-            'order_id': order.id,
-            'whatsapp_url': whatsapp_url,
-            'message': 'Order created successfully'
-        }, status=status.HTTP_201_CREATED)
+        try:
+            body, replayed = orders.place_order(serializer, order_response, key, fingerprint)
+        except orders.IdempotencyConflict:
+            return idempotency_error(
+                'This key was already used with a different request.', status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        except inventory.InsufficientStock as exc:
+            return Response({
+                'success': False,
+                'errors': {'order_items': exc.errors}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        headers = {'Idempotent-Replayed': 'true'} if replayed else None
+        return Response(body, status=status.HTTP_201_CREATED, headers=headers)
 
     return Response({
         'success': False,
@@ -82,16 +268,42 @@ def init_products(request):
     # Initialize sample products
     return Response({'success': True})
 
-@api_view(['GET'])
-def get_cart(request, session_id='default'):
-    # Return cart data
-    return Response({
-        'items': [],
-        'total': 0,
-        'item_count': 0
-    })
+def cart_session_key(request):
+    # Creating the session is the only database write a cart request makes
+    if request.session.session_key is None:
+        request.session.save()
+    return request.session.session_key
+
+@api_view(['GET', 'DELETE'])
+def get_cart(request):
+    if request.method == 'DELETE':
+        items = cart.clear(cart_session_key(request))
+    elif request.session.session_key is None:
+        items = {}
+    else:
+        items = cart.get_items(request.session.session_key)
+    return Response(cart.priced_cart(items))
 
 @api_view(['POST'])
 def add_to_cart(request):
-    # Add item to cart logic
-    return Response({'success': True})
+    serializer = CartItemSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        items = cart.add_item(
+            cart_session_key(request), serializer.validated_data['product'], serializer.validated_data['quantity']
+        )
+    except cart.CartFull as exc:
+        return Response({'success': False, 'errors': {'product': [str(exc)]}}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(cart.priced_cart(items))
+
+@api_view(['PATCH', 'DELETE'])
+def update_cart_item(request, product_id):
+    quantity = 0
+    if request.method == 'PATCH':
+        serializer = CartQuantitySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        quantity = serializer.validated_data['quantity']
+    items = cart.set_quantity(cart_session_key(request), product_id, quantity)
+    return Response(cart.priced_cart(items))